@@ -0,0 +1,221 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+# keep CSV written to stdout free of pygame's banner
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from beatmap_index import BeatmapIndex
+from judgement import JudgementEngine
+from player import Beatmap, Mods
+from replay_stream import GameMode, ReplayStream
+from timeline import KEY_BUTTONS, ReplayTimeline
+
+FIELDS = [
+    'path', 'player', 'mode', 'mods', 'mods_value', 'beatmap_hash', 'beatmap_path', 'score', 'max_combo',
+    'timestamp', 'frame_count', 'duration_ms', 'cursor_travel', 'presses_k1', 'presses_k2', 'presses_m1',
+    'presses_m2', 'judged_300', 'judged_100', 'judged_50', 'judged_miss', 'judged_accuracy',
+    'judged_max_combo', 'unstable_rate', 'error',
+]
+
+# per-process state set up by init_worker
+_index = None
+_cache_dir = None
+_beatmaps = {}
+_judge = True
+
+
+def init_worker(db_path, cache_dir, judge):
+    global _index, _cache_dir, _judge
+    # workers share the parent's stdout, which may be the CSV/JSONL output; beatmap warnings go to stderr
+    sys.stdout = sys.stderr
+    _index = BeatmapIndex(db_path) if db_path and os.path.exists(db_path) else None
+    _cache_dir = cache_dir
+    _judge = judge
+
+
+def load_beatmap(beatmap_hash):
+    if beatmap_hash in _beatmaps:
+        return _beatmaps[beatmap_hash]
+    beatmap = None
+    path = _index.lookup(beatmap_hash) if _index else None
+    if path:
+        beatmap = Beatmap(path, cache_dir=_cache_dir)
+    # replays of the same map tend to arrive together; keep the cache small
+    if len(_beatmaps) >= 64:
+        _beatmaps.pop(next(iter(_beatmaps)))
+    _beatmaps[beatmap_hash] = beatmap
+    return beatmap
+
+
+def analyse_replay(path):
+    row = {'path': path}
+    try:
+        stream = ReplayStream(path)
+        replay = stream.header
+        mods = Mods(int(replay.mods))
+        row.update({
+            'player': replay.username,
+            'mode': replay.mode.name,
+            'mods': mods.label,
+            'mods_value': int(mods),
+            'beatmap_hash': replay.beatmap_hash,
+            'score': replay.score,
+            'max_combo': replay.max_combo,
+            'timestamp': replay.timestamp.isoformat(),
+        })
+        timeline = ReplayTimeline.from_stream(stream)
+        timeline.load_all()
+        row['frame_count'] = len(timeline)
+        if replay.mode != GameMode.STD:
+            row['error'] = "only osu!standard replays are analysed"
+            return row
+
+        row['duration_ms'] = timeline.duration
+        row['cursor_travel'] = float(np.hypot(np.diff(timeline.x), np.diff(timeline.y)).sum())
+        for name, _, _ in KEY_BUTTONS:
+            counts = timeline.press_counts[name]
+            row[f'presses_{name.lower()}'] = int(counts[-1]) if len(counts) else 0
+
+        beatmap = load_beatmap(replay.beatmap_hash)
+        if beatmap is not None:
+            row['beatmap_path'] = beatmap.file_path
+            if _judge:
+                result = JudgementEngine(beatmap, mods).judge(timeline)
+                counts = result.counts
+                row.update({
+                    'judged_300': counts[300],
+                    'judged_100': counts[100],
+                    'judged_50': counts[50],
+                    'judged_miss': counts[0],
+                    'judged_accuracy': result.accuracy,
+                    'judged_max_combo': result.max_combo,
+                    'unstable_rate': result.unstable_rate(),
+                })
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+
+class CsvWriter:
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        pass
+
+
+class JsonlWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps({field: row.get(field) for field in FIELDS}) + '\n')
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    def __init__(self, path, batch_size=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([
+            (field, pyarrow.string() if field in ('path', 'player', 'mode', 'mods', 'beatmap_hash', 'beatmap_path',
+                                                  'timestamp', 'error') else pyarrow.float64())
+            for field in FIELDS])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.batch_size = batch_size
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            columns = {field: [row.get(field) for row in self.rows] for field in FIELDS}
+            self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def find_replays(inputs, recursive=False):
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*.osr') if recursive else os.path.join(item, '*.osr')
+            yield from sorted(glob.iglob(pattern, recursive=recursive))
+        else:
+            yield from sorted(glob.iglob(item, recursive=True))
+
+
+def open_writer(output, output_format):
+    if output_format is None:
+        extension = os.path.splitext(output)[1].lower() if output else ''
+        output_format = {'.jsonl': 'jsonl', '.parquet': 'parquet'}.get(extension, 'csv')
+    if output_format == 'parquet':
+        if not output:
+            raise SystemExit("Parquet output needs --output")
+        return ParquetWriter(output), None
+    stream = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    writer = JsonlWriter(stream) if output_format == 'jsonl' else CsvWriter(stream)
+    return writer, stream if output else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract per-replay statistics from many .osr files")
+    parser.add_argument('inputs', nargs='+', help="replay folders or glob patterns")
+    parser.add_argument('--recursive', action='store_true', help="also search subfolders of replay folders")
+    parser.add_argument('--osu-folder', help="osu! folder holding beatmap_index.db and parsed_beatmaps")
+    parser.add_argument('--output', help="output file (default: CSV on stdout)")
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help="default: from the output extension")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--chunksize', type=int, default=16, help="replays handed to a worker at a time")
+    parser.add_argument('--no-judge', action='store_true', help="skip hit judgement")
+    args = parser.parse_args()
+
+    db_path = cache_dir = None
+    if args.osu_folder:
+        db_path = os.path.join(args.osu_folder, 'beatmap_index.db')
+        cache_dir = os.path.join(args.osu_folder, 'parsed_beatmaps')
+
+    writer, stream = open_writer(args.output, args.format)
+    start = time.perf_counter()
+    done = failed = 0
+    with Pool(args.workers, initializer=init_worker, initargs=(db_path, cache_dir, not args.no_judge)) as pool:
+        for row in pool.imap_unordered(analyse_replay, find_replays(args.inputs, args.recursive), args.chunksize):
+            writer.write(row)
+            done += 1
+            failed += 'error' in row
+            if done % 1000 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"Processed {done} replays ({done / elapsed:.0f}/s)", file=sys.stderr)
+    writer.close()
+    if stream:
+        stream.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {done} replays ({failed} with errors) in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
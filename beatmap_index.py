@@ -0,0 +1,174 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def md5_file(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def _hash_entry(entry):
+    file_path, mtime, size = entry
+    try:
+        return file_path, md5_file(file_path), mtime, size, None
+    except OSError as e:
+        return file_path, None, mtime, size, str(e)
+
+
+def print_progress(done, total, elapsed):
+    rate = done / elapsed if elapsed > 0 else 0
+    print(f"Indexed {done}/{total} beatmaps ({rate:.0f} files/s)")
+
+
+class BeatmapIndex:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS beatmaps (
+                path TEXT PRIMARY KEY,
+                md5 TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS beatmaps_md5 ON beatmaps (md5);
+            CREATE TABLE IF NOT EXISTS aliases (
+                md5 TEXT PRIMARY KEY,
+                path TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM beatmaps").fetchone()[0]
+
+    def lookup(self, beatmap_hash):
+        row = self.conn.execute(
+            "SELECT path, mtime, size FROM beatmaps WHERE md5 = ?", (beatmap_hash,)).fetchone()
+        if row:
+            path, mtime, size = row
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            # a file edited since it was indexed may no longer have this hash
+            if st.st_mtime == mtime and st.st_size == size:
+                return path
+            return None
+
+        row = self.conn.execute("SELECT path FROM aliases WHERE md5 = ?", (beatmap_hash,)).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+
+    def add(self, file_path, beatmap_hash=None):
+        st = os.stat(file_path)
+        if beatmap_hash is None:
+            beatmap_hash = md5_file(file_path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO beatmaps (path, md5, mtime, size) VALUES (?, ?, ?, ?)",
+            (file_path, beatmap_hash, st.st_mtime, st.st_size))
+        self.conn.commit()
+        return beatmap_hash
+
+    def add_alias(self, beatmap_hash, file_path):
+        self.conn.execute("INSERT OR REPLACE INTO aliases (md5, path) VALUES (?, ?)", (beatmap_hash, file_path))
+        self.conn.commit()
+
+    def scan(self, songs_folder):
+        for root, dirs, files in os.walk(songs_folder):
+            for file in files:
+                if file.endswith('.osu'):
+                    file_path = os.path.join(root, file)
+                    try:
+                        st = os.stat(file_path)
+                    except OSError:
+                        continue
+                    yield file_path, st.st_mtime, st.st_size
+
+    def refresh(self, songs_folder, workers=None, processes=False, batch_size=500,
+                progress=print_progress, progress_interval=1.0):
+        known = {path: (mtime, size) for path, mtime, size in
+                 self.conn.execute("SELECT path, mtime, size FROM beatmaps")}
+        seen = set()
+        changed = []
+        for file_path, mtime, size in self.scan(songs_folder):
+            seen.add(file_path)
+            if known.get(file_path) != (mtime, size):
+                changed.append((file_path, mtime, size))
+
+        songs_prefix = os.path.join(songs_folder, '')
+        removed = [(path,) for path in known if path not in seen and path.startswith(songs_prefix)]
+        with self.conn:
+            self.conn.executemany("DELETE FROM beatmaps WHERE path = ?", removed)
+
+        if not changed:
+            return 0, len(removed)
+
+        workers = workers or os.cpu_count() or 1
+        if processes:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            chunksize = max(1, min(256, len(changed) // (workers * 4)))
+        else:
+            # file reads and hashlib both release the GIL, so threads overlap I/O well
+            executor = ThreadPoolExecutor(max_workers=workers * 2)
+            chunksize = 1
+
+        added = 0
+        batch = []
+        start = last_report = time.perf_counter()
+        with executor:
+            for done, (file_path, md5, mtime, size, error) in enumerate(
+                    executor.map(_hash_entry, changed, chunksize=chunksize), 1):
+                if error:
+                    print(f"Error reading file {file_path}: {error}")
+                else:
+                    batch.append((file_path, md5, mtime, size))
+                if len(batch) >= batch_size:
+                    added += self._write_batch(batch)
+                    batch = []
+                now = time.perf_counter()
+                if progress and now - last_report >= progress_interval:
+                    progress(done, len(changed), now - start)
+                    last_report = now
+        added += self._write_batch(batch)
+        if progress:
+            progress(len(changed), len(changed), time.perf_counter() - start)
+        return added, len(removed)
+
+    def _write_batch(self, rows):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO beatmaps (path, md5, mtime, size) VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the beatmap index for an osu! Songs folder")
+    parser.add_argument('songs_folder', help="path to the osu! Songs folder")
+    parser.add_argument('--db', help="index file (default: beatmap_index.db next to the Songs folder)")
+    parser.add_argument('--workers', type=int, default=None, help="number of hashing workers")
+    parser.add_argument('--processes', action='store_true', help="hash in a process pool instead of threads")
+    parser.add_argument('--batch-size', type=int, default=500, help="rows per database write")
+    args = parser.parse_args()
+
+    songs_folder = os.path.abspath(args.songs_folder)
+    db_path = args.db or os.path.join(os.path.dirname(songs_folder), 'beatmap_index.db')
+    index = BeatmapIndex(db_path)
+    start = time.perf_counter()
+    added, removed = index.refresh(songs_folder, workers=args.workers, processes=args.processes,
+                                   batch_size=args.batch_size)
+    print(f"Indexed {added} new or changed beatmaps, removed {removed}, "
+          f"{len(index)} total in {time.perf_counter() - start:.1f}s")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
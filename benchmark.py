@@ -0,0 +1,390 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# must be set before pygame initialises its video subsystem
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import pygame
+
+from beatmap_index import BeatmapIndex, md5_file
+from lazy_import import lazy_import
+from player import Beatmap, HitObjectStore, OSRPlayer
+from replay_stream import ReplayStream
+from timeline import ReplayTimeline
+
+# the player reads replays itself; osrparse is only used to write the synthetic ones
+osrparse = lazy_import('osrparse', "Generating benchmark replays")
+
+BENCHMARK_VERSION = 1
+POLLING_RATES = (1, 4, 8, 16)
+# length of the polling-rate replays at scale 1; writing them with osrparse dominates setup time
+REPLAY_DURATION = 300000
+
+# object counts at scale 1
+MAP_KINDS = {
+    'streams': 3000,
+    'sliders': 800,
+    'marathon': 12000,
+}
+
+HEADER = """osu file format v14
+
+[General]
+AudioFilename: audio.mp3
+AudioLeadIn: 0
+Mode: 0
+
+[Metadata]
+Title:{title}
+Artist:Benchmark
+Creator:benchmark
+Version:{version}
+BeatmapID:0
+
+[Difficulty]
+HPDrainRate:5
+CircleSize:4
+OverallDifficulty:8
+ApproachRate:9
+SliderMultiplier:1.8
+SliderTickRate:1
+
+[TimingPoints]
+{timing_points}
+
+[HitObjects]
+"""
+
+
+def stream_objects(rng, count, beat_length):
+    # 1/4 streams in short jumps, the densest object spacing ranked maps use
+    lines = []
+    time = 1000.0
+    x, y = 256.0, 192.0
+    for i in range(count):
+        x = float(np.clip(x + rng.normal(0, 30), 0, 512))
+        y = float(np.clip(y + rng.normal(0, 30), 0, 384))
+        lines.append(f"{int(x)},{int(y)},{int(time)},{5 if i % 16 == 0 else 1},0,0:0:0:0:")
+        time += beat_length / 4
+    return lines, time
+
+
+def slider_objects(rng, count, beat_length):
+    # long many-anchor bezier sliders with repeats
+    lines = []
+    time = 1000.0
+    for i in range(count):
+        anchors = rng.integers(0, (512, 384), size=(int(rng.integers(4, 16)), 2))
+        curve = '|'.join(f"{x}:{y}" for x, y in anchors[1:])
+        repeat = int(rng.integers(1, 4))
+        length = float(rng.uniform(200, 600))
+        lines.append(f"{anchors[0][0]},{anchors[0][1]},{int(time)},2,0,B|{curve},{repeat},{length:.1f}")
+        time += length / (1.8 * 100) * beat_length * repeat + beat_length
+    return lines, time
+
+
+def marathon_objects(rng, count, beat_length):
+    # a mix of everything, long enough that culling and lookups have to scale
+    lines = []
+    time = 1000.0
+    for i in range(count):
+        x, y = (int(v) for v in rng.integers(0, (512, 384)))
+        kind = i % 20
+        if kind < 14:
+            lines.append(f"{x},{y},{int(time)},1,0,0:0:0:0:")
+            time += beat_length / 2
+        elif kind < 19:
+            curve_type = 'BLP'[kind % 3]
+            anchors = rng.integers(0, (512, 384), size=(3 if curve_type == 'P' else 4, 2))
+            curve = '|'.join(f"{ax}:{ay}" for ax, ay in anchors)
+            lines.append(f"{x},{y},{int(time)},2,0,{curve_type}|{curve},1,150")
+            time += 150 / 180 * beat_length + beat_length / 2
+        else:
+            lines.append(f"256,192,{int(time)},12,0,{int(time + beat_length * 4)},0:0:0:0:")
+            time += beat_length * 5
+    return lines, time
+
+
+GENERATORS = {'streams': stream_objects, 'sliders': slider_objects, 'marathon': marathon_objects}
+
+
+def generate_beatmap(path, kind, count, seed=0, title='Benchmark'):
+    rng = np.random.default_rng(seed)
+    beat_length = 60000 / 200
+    lines, end_time = GENERATORS[kind](rng, count, beat_length)
+    # an inherited point every few bars changes slider velocity, like most real maps
+    timing_points = [f"0,{beat_length},4,2,0,60,1,0"]
+    for t in np.arange(4000, end_time, beat_length * 16):
+        timing_points.append(f"{int(t)},{-100 / rng.uniform(0.5, 2):.2f},4,2,0,60,0,0")
+    with open(path, 'w', newline='\r\n') as f:
+        f.write(HEADER.format(title=title, version=f"{kind} {seed}", timing_points='\n'.join(timing_points)))
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def generate_replay(path, beatmap, polling_ms, seed=0, duration=None):
+    rng = np.random.default_rng(seed)
+    objects = beatmap.hit_objects
+    if duration is None:
+        duration = float(objects.end_time.max()) + 1000 if len(objects) else 10000
+    times = np.arange(0, duration, polling_ms)
+    # move towards each object in turn, with some hand jitter
+    order = np.argsort(objects.time, kind='stable')
+    x = np.interp(times, objects.time[order], objects.x[order]) + rng.normal(0, 3, len(times))
+    y = np.interp(times, objects.time[order], objects.y[order]) + rng.normal(0, 3, len(times))
+    start = np.searchsorted(times, objects.time[order])
+    keys = np.zeros(len(times), dtype=np.int32)
+    # K1 and K2 alternate, and each sets its matching mouse bit like stable does
+    for n, i in enumerate(start):
+        keys[i:i + max(1, int(50 / polling_ms))] = 5 if n % 2 == 0 else 10
+
+    Key, ReplayEventOsu = osrparse.Key, osrparse.ReplayEventOsu
+    events = [ReplayEventOsu(0, 256, -500, Key(0)), ReplayEventOsu(-1, 256, -500, Key(0))]
+    events += [ReplayEventOsu(polling_ms, float(px), float(py), Key(int(k))) for px, py, k in zip(x, y, keys)]
+    replay = osrparse.Replay(osrparse.GameMode.STD, 20240101, md5_file(beatmap.file_path), 'benchmark', '0' * 32,
+                             len(objects), 0, 0, 0, 0, 0, 1000000, len(objects), 0, osrparse.Mod(0), None,
+                             datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc), events, 0, 0)
+    replay.write_path(path)
+    return path
+
+
+def generate_songs_tree(songs_folder, sets, maps_per_set, seed=0):
+    paths = []
+    for s in range(sets):
+        folder = os.path.join(songs_folder, f"{s} Benchmark - Set {s}")
+        os.makedirs(folder, exist_ok=True)
+        for m in range(maps_per_set):
+            path = os.path.join(folder, f"Benchmark - Set {s} (benchmark) [Diff {m}].osu")
+            generate_beatmap(path, 'streams', 50, seed=seed + s * maps_per_set + m, title=f"Set {s}")
+            paths.append(path)
+    return paths
+
+
+def measure(function, repeat, items=1):
+    # the fastest run is the least disturbed by the rest of the machine; keep the median for noise estimates
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'mean_s': statistics.fmean(times),
+        'repeat': repeat,
+        'items': items,
+        'items_per_s': items / min(times) if min(times) > 0 else None,
+    }
+
+
+def bench_parse(maps, cache_dir, repeat):
+    results = {}
+    for kind, path in maps.items():
+        results[f'parse/{kind}'] = measure(lambda: Beatmap(path), repeat, len(Beatmap(path).hit_objects))
+        Beatmap(path, cache_dir=cache_dir)
+        results[f'parse_cached/{kind}'] = measure(lambda: Beatmap(path, cache_dir=cache_dir), repeat,
+                                                  len(Beatmap(path).hit_objects))
+    return results
+
+
+def bench_replays(replays, repeat):
+    results = {}
+    for polling_ms, path in replays.items():
+        def decode():
+            timeline = ReplayTimeline.from_stream(ReplayStream(path))
+            timeline.load_all()
+            return timeline
+        results[f'replay_decode/{polling_ms}ms'] = measure(decode, repeat, len(decode()))
+    return results
+
+
+def bench_lookup(work_dir, sets, maps_per_set, repeat, seed):
+    songs_folder = os.path.join(work_dir, 'Songs')
+    paths = generate_songs_tree(songs_folder, sets, maps_per_set, seed)
+    hashes = [md5_file(path) for path in paths]
+    db_path = os.path.join(work_dir, 'beatmap_index.db')
+
+    def cold_refresh():
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        index = BeatmapIndex(db_path)
+        index.refresh(songs_folder, progress=None)
+        index.close()
+
+    results = {'lookup/refresh_cold': measure(cold_refresh, repeat, len(paths))}
+    index = BeatmapIndex(db_path)
+    results['lookup/refresh_unchanged'] = measure(lambda: index.refresh(songs_folder, progress=None), repeat,
+                                                  len(paths))
+    rng = np.random.default_rng(seed)
+    queries = [hashes[i] for i in rng.integers(0, len(hashes), 1000)]
+    results['lookup/by_hash'] = measure(lambda: [index.lookup(h) for h in queries], repeat, len(queries))
+    index.close()
+    return results
+
+
+def bench_culling(maps, repeat, samples=10000):
+    results = {}
+    for kind, path in maps.items():
+        store = HitObjectStore(Beatmap(path).hit_objects, lambda x, y, time: (x, y, time))
+        times = np.linspace(0, float(store.objects.end_time.max()), samples)
+        results[f'culling/{kind}'] = measure(lambda: [store.visible(t) for t in times], repeat, samples)
+    return results
+
+
+def bench_render(maps, replays_folder, repeat, frames, size):
+    results = {}
+    pygame.init()
+    for kind, (beatmap_path, replay_path) in maps.items():
+        player = OSRPlayer(display_width=size[0], display_height=size[1], replay_folder=replays_folder,
+                           interactive=False)
+        player.font = pygame.font.Font(None, 24)
+        player.load_replay(replay_path, beatmap_path=beatmap_path)
+        player.timeline.load_all()
+        screen = pygame.Surface(size)
+        # step through the whole map so dense and sparse sections are both sampled
+        times = np.linspace(0, player.timeline.duration, frames)
+
+        def render():
+            for t in times:
+                player.render_frame(screen, t, player.timeline.cursor_at(t), debug=True)
+        render()
+        allocations = player.sprites.allocations
+        result = measure(render, repeat, frames)
+        result['allocations_per_frame'] = (player.sprites.allocations - allocations) / (frames * repeat)
+        results[f'render/{kind}'] = result
+    pygame.quit()
+    return results
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix='osr_bench_')
+    try:
+        songs_folder = os.path.join(work_dir, 'Songs', 'bench')
+        replays_folder = os.path.join(work_dir, 'Replays')
+        cache_dir = os.path.join(work_dir, 'parsed_beatmaps')
+        os.makedirs(songs_folder)
+        os.makedirs(replays_folder)
+
+        maps = {}
+        for kind, count in MAP_KINDS.items():
+            path = os.path.join(songs_folder, f"{kind}.osu")
+            maps[kind] = generate_beatmap(path, kind, max(10, int(count * args.scale)), seed=args.seed)
+        replays = {}
+        for polling_ms in POLLING_RATES:
+            path = os.path.join(replays_folder, f"marathon {polling_ms}ms.osr")
+            replays[polling_ms] = generate_replay(path, Beatmap(maps['marathon']), polling_ms, seed=args.seed,
+                                                  duration=REPLAY_DURATION * args.scale)
+        render_maps = {}
+        for kind, path in maps.items():
+            replay_path = os.path.join(replays_folder, f"{kind}.osr")
+            render_maps[kind] = (path, generate_replay(replay_path, Beatmap(path), 16, seed=args.seed))
+
+        selected = set(args.only or ['parse', 'replay', 'lookup', 'culling', 'render'])
+        results = {}
+        if 'parse' in selected:
+            results.update(bench_parse(maps, cache_dir, args.repeat))
+        if 'replay' in selected:
+            results.update(bench_replays(replays, args.repeat))
+        if 'lookup' in selected:
+            results.update(bench_lookup(os.path.join(work_dir, 'lookup'), max(1, int(400 * args.scale)), 5,
+                                        args.repeat, args.seed))
+        if 'culling' in selected:
+            results.update(bench_culling(maps, args.repeat))
+        if 'render' in selected:
+            results.update(bench_render(render_maps, replays_folder, args.repeat, args.frames, args.size))
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline, results, threshold):
+    # compare the fastest runs; a slowdown beyond the threshold counts as a regression
+    regressions = 0
+    print(f"{'benchmark':<32} {'baseline':>10} {'current':>10} {'change':>8}", file=sys.stderr)
+    for name, result in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f"{name:<32} {'-':>10} {result['min_s'] * 1000:>8.2f}ms {'new':>8}", file=sys.stderr)
+            continue
+        change = result['min_s'] / old['min_s'] - 1 if old['min_s'] else 0
+        flag = ' !' if change > threshold else ''
+        regressions += change > threshold
+        print(f"{name:<32} {old['min_s'] * 1000:>8.2f}ms {result['min_s'] * 1000:>8.2f}ms {change:>+7.0%}{flag}",
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark beatmap parsing, lookup, culling and rendering")
+    parser.add_argument('--output', help="write the JSON report here (default: stdout)")
+    parser.add_argument('--compare', help="earlier JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="slowdown counted as a regression")
+    parser.add_argument('--only', nargs='+', choices=['parse', 'replay', 'lookup', 'culling', 'render'])
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply generated map and library sizes")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--frames', type=int, default=300, help="frames rendered per map")
+    parser.add_argument('--size', default='1280x720', help="render size as WIDTHxHEIGHT")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    args.size = tuple(int(v) for v in args.size.lower().split('x'))
+
+    # generation and loading print progress; keep stdout for the report
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        results = run(args)
+    finally:
+        sys.stdout = stdout
+
+    report = {
+        'version': BENCHMARK_VERSION,
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pygame': pygame.version.ver,
+            'cpu_count': os.cpu_count(),
+            'args': {'scale': args.scale, 'repeat': args.repeat, 'frames': args.frames,
+                     'size': list(args.size), 'seed': args.seed},
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['meta']['args'] != report['meta']['args']:
+            print("Warning: baseline was run with different arguments", file=sys.stderr)
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from loader import open_timeline
+from player import Mods, OSRPlayer, pygame
+from replay_stream import GameMode, ReplayStream
+from timeline import PlaybackClock, TimelineStack
+
+TRAIL_SAMPLES = 12
+
+
+def load_timeline(osr_file):
+    try:
+        stream = ReplayStream(osr_file)
+        timeline = open_timeline(stream)
+        timeline.load_all()
+    except Exception as e:
+        return osr_file, None, None, e
+    return osr_file, stream.header, timeline, None
+
+
+def replay_colors(count):
+    # evenly spaced hues keep dozens of cursors apart
+    colors = []
+    for i in range(count):
+        color = pygame.Color(0)
+        color.hsva = (360 * i / count, 75, 100, 100)
+        colors.append((color.r, color.g, color.b))
+    return colors
+
+
+def find_replays(inputs):
+    for item in inputs:
+        if os.path.isdir(item):
+            yield from sorted(glob.iglob(os.path.join(item, '*.osr')))
+        else:
+            yield from sorted(glob.iglob(item))
+
+
+class ComparisonView:
+    def __init__(self, player, trail_ms=300, trail_samples=TRAIL_SAMPLES):
+        self.player = player
+        self.trail_offsets = np.linspace(trail_ms, 0, trail_samples, endpoint=False)
+        self.stack = None
+        self.names = []
+        self.colors = []
+        self.cursor_sprites = []
+        self.pressed_sprites = []
+        self.trail_sprites = []
+        self.legend = []
+        self.cursor_half = self.pressed_half = 0
+        self.trail_halves = 0
+
+    def load(self, replay_files, workers=None):
+        # the first replay picks the beatmap and the mods it is shown with
+        if not self.player.load_replay(replay_files[0]) or self.player.replay is None:
+            return False
+        reference = self.player.replay
+
+        headers, timelines = [], []
+        # LZMA decompression releases the GIL, so threads decode several replays at once
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for osr_file, header, timeline, error in executor.map(load_timeline, replay_files):
+                if error is not None:
+                    print(f"Skipping {osr_file}: {error}")
+                elif header.beatmap_hash != reference.beatmap_hash:
+                    print(f"Skipping {osr_file}: it is for a different beatmap")
+                elif header.mode != GameMode.STD or len(timeline) == 0:
+                    print(f"Skipping {osr_file}: not an osu!standard replay with cursor data")
+                else:
+                    headers.append(header)
+                    timelines.append(timeline)
+        if not timelines:
+            return False
+
+        # timelines from open_timeline are all in map space, so HR and non-HR plays line up
+        self.stack = TimelineStack(timelines)
+
+        # the comparison draws its own cursors, so the single-replay cursor and key overlay stay off
+        self.player.timeline = None
+        self.names = [f"{header.username} ({Mods(header.mods).label})" for header in headers]
+        self.colors = replay_colors(len(headers))
+        print(f"Comparing {len(headers)} replays of {reference.beatmap_hash}")
+        return True
+
+    def build_sprites(self):
+        sprites = self.player.sprites
+        radius = max(3, int(5 * self.player.scale_y))
+        self.cursor_sprites, self.pressed_sprites, self.trail_sprites = [], [], []
+        for color in self.colors:
+            for size, target in ((radius, self.cursor_sprites), (radius * 2, self.pressed_sprites)):
+                surf = sprites.new_surface(size * 2, size * 2)
+                pygame.draw.circle(surf, color, (size, size), size)
+                pygame.draw.circle(surf, (255, 255, 255), (size, size), size, 1)
+                target.append(surf)
+            # older trail samples are smaller and fainter
+            trail = []
+            for n in range(len(self.trail_offsets)):
+                age = 1 - n / len(self.trail_offsets)
+                size = max(1, int(radius * (1 - 0.6 * age)))
+                surf = sprites.new_surface(size * 2, size * 2)
+                pygame.draw.circle(surf, color + (int(200 * (1 - age)) + 30,), (size, size), size)
+                trail.append(surf)
+            self.trail_sprites.append(trail)
+        self.cursor_half = radius
+        self.pressed_half = radius * 2
+        self.trail_halves = np.array([surf.get_width() // 2 for surf in self.trail_sprites[0]]) if self.trail_sprites else 0
+
+        font = self.player.font
+        # the legend stops above the mod buttons
+        buttons_top = min((button.rect.top for mod, button in self.player.mod_buttons), default=self.player.display_height)
+        rows = max(1, (buttons_top - 20) // 20)
+        self.legend = []
+        for i, (name, color) in enumerate(zip(self.names, self.colors)):
+            if i == rows - 1 and len(self.names) > rows:
+                self.legend.append((sprites.text(font, f"+{len(self.names) - i} more", (255, 255, 255)), (10, 10 + i * 20)))
+                break
+            self.legend.append((sprites.text(font, name, color), (10, 10 + i * 20)))
+
+    def draw_cursors(self, screen, current_time):
+        stack = self.stack
+        player = self.player
+        x, y, frames = stack.cursors_at(current_time)
+        held = (stack.keys[frames] & 3) != 0
+        trail_x, trail_y, _ = stack.cursors_at(current_time - np.broadcast_to(self.trail_offsets, (len(stack), len(self.trail_offsets))))
+
+        # one transform for every cursor and trail sample instead of one call per replay
+        x, y, _ = player.apply_mods(x, y, 0)
+        trail_x, trail_y, _ = player.apply_mods(trail_x, trail_y, 0)
+        x, y = player.scale_position(x, y)
+        trail_x, trail_y = player.scale_position(trail_x, trail_y)
+        # sprite corners for every sample at once, so the loops below only pair them up
+        trail_x = (trail_x - self.trail_halves).astype(np.int32).tolist()
+        trail_y = (trail_y - self.trail_halves).astype(np.int32).tolist()
+        half = np.where(held, self.pressed_half, self.cursor_half)
+        x = (x - half).astype(np.int32).tolist()
+        y = (y - half).astype(np.int32).tolist()
+
+        blits = []
+        for trail, row_x, row_y in zip(self.trail_sprites, trail_x, trail_y):
+            blits.extend(zip(trail, zip(row_x, row_y)))
+        for cursor, pressed, px, py, down in zip(self.cursor_sprites, self.pressed_sprites, x, y, held.tolist()):
+            blits.append((pressed if down else cursor, (px, py)))
+        blits.extend(self.legend)
+        screen.blits(blits, doreturn=False)
+
+    def run(self):
+        player = self.player
+        screen = player.open_window()
+        self.build_sprites()
+        player.profiler = None
+        clock = player.clock
+        duration = self.stack.duration
+
+        print("Controls: DELETE to pause/resume, LEFT/RIGHT to seek 5s, HOME to restart, "
+              "click or drag the bar at the bottom to scrub, ESC to stop")
+        playback = PlaybackClock(speed=player.playback_speed())
+        scrubbing = False
+        running = True
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_DELETE:
+                        playing = playback.toggle()
+                        print("Comparison paused" if not playing else "Comparison resumed")
+                    elif event.key == pygame.K_ESCAPE:
+                        running = False
+                    elif event.key == pygame.K_LEFT:
+                        playback.seek(max(0, playback.now() - 5000))
+                    elif event.key == pygame.K_RIGHT:
+                        playback.seek(min(duration, playback.now() + 5000))
+                    elif event.key == pygame.K_HOME:
+                        playback.seek(0)
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    if player.timeline_bar_rect().collidepoint(event.pos):
+                        scrubbing = True
+                        playback.seek(player.timeline_position_time(event.pos[0], duration))
+                    elif player.handle_mod_button_click(event.pos):
+                        playback.set_speed(player.playback_speed())
+                        print(f"Active mods: {player.active_mods}")
+                elif event.type == pygame.MOUSEMOTION and scrubbing:
+                    playback.seek(player.timeline_position_time(event.pos[0], duration))
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    scrubbing = False
+
+            current_time = playback.now()
+            if current_time > duration and not scrubbing:
+                print("Comparison finished")
+                break
+
+            player.render_frame(screen, current_time, None, debug=False)
+            self.draw_cursors(screen, current_time)
+            for mod, button in player.mod_buttons:
+                button.draw(screen)
+            player.draw_timeline_bar(screen, current_time, duration)
+            pygame.display.flip()
+            clock.tick(60)
+
+        player.close_window()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overlay many replays of one beatmap on a shared timeline")
+    parser.add_argument('replays', nargs='+', help="replay files, folders or glob patterns; the first one picks the beatmap")
+    parser.add_argument('--replay-folder', help="osu! Replays folder used for beatmap lookup")
+    parser.add_argument('--size', default='1280x720', help="window size as WIDTHxHEIGHT")
+    parser.add_argument('--trail', type=float, default=300, help="cursor trail length in ms")
+    parser.add_argument('--workers', type=int, default=None, help="threads decoding replays")
+    args = parser.parse_args()
+
+    replay_files = list(find_replays(args.replays))
+    if not replay_files:
+        raise SystemExit("No replays found")
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    player = OSRPlayer(display_width=size[0], display_height=size[1], replay_folder=args.replay_folder)
+    view = ComparisonView(player, trail_ms=args.trail)
+    if view.load(replay_files, workers=args.workers):
+        view.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import numpy as np
+
+from player import Beatmap, Mods, OBJECT_SLIDER, OBJECT_SPINNER
+from slider_path import SliderPaths
+from timeline import ReplayTimeline
+
+HIT_300 = 300
+HIT_100 = 100
+HIT_50 = 50
+MISS = 0
+
+# stable lets the slider end be tracked slightly early
+SLIDER_END_LENIENCY = 36
+FOLLOW_RADIUS_SCALE = 2.4
+
+
+def hit_windows(od, mods=Mods.NoMod, song_time=True):
+    windows = np.array([80 - 6 * od, 140 - 8 * od, 200 - 10 * od])
+    if song_time:
+        # replay frames are stamped in song time, where DT/HT leave the windows unchanged
+        return windows
+    if mods & (Mods.DoubleTime | Mods.Nightcore):
+        return windows / 1.5
+    if mods & Mods.HalfTime:
+        return windows / 0.75
+    return windows
+
+
+def spins_per_second(od):
+    if od > 5:
+        return 5 + 2.5 * (od - 5) / 5
+    return 5 - 2 * (5 - od) / 5
+
+
+class JudgementResult:
+    def __init__(self, time, type, result, hit_error, combo, max_combo=None):
+        self.time = time
+        self.type = type
+        self.result = result
+        self.hit_error = hit_error
+        # combo reached at the end of each object, counted in combo points like the replay's max_combo
+        self.combo = combo
+        self._max_combo = max_combo
+
+    def __len__(self):
+        return len(self.result)
+
+    @property
+    def counts(self):
+        return {value: int(np.count_nonzero(self.result == value)) for value in (HIT_300, HIT_100, HIT_50, MISS)}
+
+    @property
+    def accuracy(self):
+        if len(self.result) == 0:
+            return 1.0
+        return float(self.result.sum() / (HIT_300 * len(self.result)))
+
+    @property
+    def max_combo(self):
+        if self._max_combo is not None:
+            return self._max_combo
+        return int(self.combo.max()) if len(self.combo) else 0
+
+    @property
+    def misses(self):
+        return np.flatnonzero(self.result == MISS)
+
+    def unstable_rate(self):
+        errors = self.hit_error[~np.isnan(self.hit_error)]
+        return float(np.std(errors) * 10) if len(errors) else 0.0
+
+
+class JudgementEngine:
+    def __init__(self, beatmap, mods=Mods.NoMod):
+        self.mods = Mods(int(mods))
+        difficulty = beatmap.difficulty_for(self.mods)
+        self.od = difficulty['OverallDifficulty']
+        self.radius = Beatmap.circle_radius(difficulty['CircleSize'])
+        self.windows = hit_windows(self.od, self.mods)
+
+        objects = beatmap.hit_objects
+        objects = objects.take(np.argsort(objects.time, kind='stable'))
+        if self.mods & Mods.HardRock:
+            # replay cursor data is recorded on the flipped playfield, so flip the map to match it
+            objects = objects.transformed(lambda x, y, time: (x, 384 - y, time))
+        self.objects = objects
+        self.slider_paths = SliderPaths(objects)
+
+    def presses(self, timeline):
+        # every rising edge of M1 or M2 is one press; K1/K2 always set the matching mouse bit
+        held = np.stack(((timeline.keys & 1) != 0, (timeline.keys & 2) != 0))
+        rising = held.copy()
+        rising[:, 1:] &= ~held[:, :-1]
+        frames = np.sort(np.concatenate((np.flatnonzero(rising[0]), np.flatnonzero(rising[1]))), kind='stable')
+        return timeline.times[frames], timeline.x[frames], timeline.y[frames]
+
+    def judge_heads(self, timeline, candidates):
+        # notelock makes each object depend on how the previous one was judged, so this is one
+        # Python-level step per object; the window bounds and lock positions are found up front
+        # and each step only checks the few presses inside its hit window
+        press_time, press_x, press_y = self.presses(timeline)
+        objects = self.objects
+        time = objects.time[candidates]
+        w300, w100, w50 = self.windows
+        first = np.searchsorted(press_time, time - w50, side='left').tolist()
+        last = np.searchsorted(press_time, time + w50, side='right').tolist()
+        # first press that may count once an object is judged by the press at an index, or missed
+        after_press = np.searchsorted(press_time, press_time, side='right').tolist()
+        object_x = objects.x[candidates].tolist()
+        object_y = objects.y[candidates].tolist()
+        distance_ok = self.radius ** 2
+
+        hit_error = np.full(len(candidates), np.nan)
+        locked = 0
+        for n in range(len(candidates)):
+            # notelock: presses before the previous object was judged cannot reach this one
+            start = max(first[n], locked)
+            end = last[n]
+            if start < end:
+                dx = press_x[start:end] - object_x[n]
+                dy = press_y[start:end] - object_y[n]
+                inside = np.flatnonzero(dx * dx + dy * dy <= distance_ok)
+                if len(inside):
+                    used = start + int(inside[0])
+                    hit_error[n] = press_time[used] - time[n]
+                    locked = after_press[used]
+                    continue
+            # a missed object is judged when its window closes
+            locked = max(locked, end)
+
+        result = np.full(len(candidates), MISS, dtype=np.int16)
+        error = np.abs(hit_error)
+        result[error <= w50] = HIT_50
+        result[error <= w100] = HIT_100
+        result[error <= w300] = HIT_300
+        return result, hit_error
+
+    def judge_slider_edges(self, timeline, sliders):
+        # each repeat edge and the slider end must be tracked: key held and cursor inside the follow circle
+        objects = self.objects
+        repeats = np.maximum(objects.repeat[sliders].astype(np.int64), 1)
+        owner = np.repeat(np.arange(len(sliders)), repeats)
+        edge = np.arange(len(owner)) - np.repeat(np.cumsum(repeats) - repeats, repeats) + 1
+        start = objects.time[sliders][owner]
+        duration = objects.end_time[sliders][owner] - start
+        edge_time = start + duration * edge / repeats[owner]
+        edge_time = np.where(edge == repeats[owner], np.maximum(start, edge_time - SLIDER_END_LENIENCY), edge_time)
+
+        positions = np.zeros((len(owner), 2))
+        edge_offsets = np.concatenate(([0], np.cumsum(repeats)))
+        for n, i in enumerate(sliders):
+            x, y = self.slider_paths.position_at(i, np.arange(1, repeats[n] + 1) / repeats[n])
+            positions[edge_offsets[n]:edge_offsets[n + 1]] = np.column_stack((x, y))
+        frame = np.maximum(np.searchsorted(timeline.search_times, edge_time, side='right') - 1, 0)
+        if len(timeline):
+            held = (timeline.keys[frame] & 3) != 0
+            dx = timeline.x[frame] - positions[:, 0]
+            dy = timeline.y[frame] - positions[:, 1]
+            tracked = held & (dx * dx + dy * dy <= (self.radius * FOLLOW_RADIUS_SCALE) ** 2)
+        else:
+            tracked = np.zeros(len(owner), dtype=bool)
+        # per edge, in slider order; the last edge of each slider is its end
+        return tracked, owner, edge == repeats[owner]
+
+    def judge_spinners(self, timeline, spinners):
+        objects = self.objects
+        result = np.full(len(spinners), MISS, dtype=np.int16)
+        if len(timeline) == 0:
+            return result
+        angles = np.arctan2(timeline.y - 192, timeline.x - 256)
+        turn = np.diff(angles, prepend=angles[:1])
+        turn = (turn + np.pi) % (2 * np.pi) - np.pi
+        turn[(timeline.keys & 3) == 0] = 0
+        spun = np.concatenate(([0.0], np.cumsum(np.abs(turn))))
+
+        first = np.searchsorted(timeline.search_times, objects.time[spinners], side='left')
+        last = np.searchsorted(timeline.search_times, objects.end_time[spinners], side='right')
+        rotations = (spun[last] - spun[first]) / (2 * np.pi)
+        required = np.floor((objects.end_time[spinners] - objects.time[spinners]) / 1000 * spins_per_second(self.od))
+        result[rotations >= np.maximum(required * 0.25, 0.5)] = HIT_50
+        result[rotations >= np.maximum(required - 1, 0.5)] = HIT_100
+        result[rotations >= required] = HIT_300
+        return result
+
+    def judge(self, timeline):
+        objects = self.objects
+        result = np.full(len(objects), MISS, dtype=np.int16)
+        hit_error = np.full(len(objects), np.nan)
+
+        heads = np.flatnonzero(objects.type != OBJECT_SPINNER)
+        head_result, head_error = self.judge_heads(timeline, heads)
+        result[heads] = head_result
+        hit_error[heads] = head_error
+        # whether each object's first combo point (its head, or the spinner itself) was earned
+        head_hit = result != MISS
+
+        sliders = np.flatnonzero(objects.type == OBJECT_SLIDER)
+        edge_tracked = edge_owner = edge_is_end = np.zeros(0, dtype=np.int64)
+        if len(sliders):
+            # stable scores a slider by the fraction of its parts (head, repeats, end) that were hit
+            edge_tracked, edge_owner, edge_is_end = self.judge_slider_edges(timeline, sliders)
+            edge_owner = sliders[edge_owner]
+            tracked = np.bincount(edge_owner, weights=edge_tracked, minlength=len(objects))[sliders]
+            parts_hit = tracked + head_hit[sliders]
+            parts = np.bincount(edge_owner, minlength=len(objects))[sliders] + 1
+            slider_result = np.full(len(sliders), MISS, dtype=np.int16)
+            slider_result[parts_hit > 0] = HIT_50
+            slider_result[parts_hit * 2 >= parts] = HIT_100
+            slider_result[parts_hit == parts] = HIT_300
+            result[sliders] = slider_result
+
+        spinners = np.flatnonzero(objects.type == OBJECT_SPINNER)
+        if len(spinners):
+            result[spinners] = self.judge_spinners(timeline, spinners)
+            head_hit[spinners] = result[spinners] != MISS
+
+        # combo points in play order: every head (or spinner) and every slider repeat and end. a missed
+        # head, spinner or repeat breaks combo; a dropped slider end only gives no point.
+        # slider ticks are not judged, so they add no points either
+        part_object = np.concatenate((np.arange(len(objects)), edge_owner))
+        part_gain = np.concatenate((head_hit, edge_tracked.astype(bool)))
+        part_break = ~part_gain & ~np.concatenate((np.zeros(len(objects), dtype=bool), edge_is_end.astype(bool)))
+        # stable sort by object keeps each slider's head first and its edges in order
+        order = np.argsort(part_object, kind='stable')
+        part_object, part_gain, part_break = part_object[order], part_gain[order], part_break[order]
+
+        points = np.cumsum(part_gain)
+        index = np.arange(len(points))
+        last_break = np.maximum.accumulate(np.where(part_break, index, -1))
+        part_combo = points - np.where(last_break >= 0, points[np.maximum(last_break, 0)], 0)
+        last_part = np.searchsorted(part_object, np.arange(len(objects)), side='right') - 1
+        combo = part_combo[last_part].astype(np.int32)
+        # a break inside a slider can come after its highest point, so the maximum is taken over parts
+        max_combo = int(part_combo.max()) if len(part_combo) else 0
+        return JudgementResult(objects.time, objects.type, result, hit_error, combo, max_combo)
+
+
+def judge_replay(beatmap, replay, mods=None):
+    timeline = replay if isinstance(replay, ReplayTimeline) else ReplayTimeline(replay.replay_data)
+    if mods is None:
+        mods = getattr(replay, 'mods', Mods.NoMod)
+    return JudgementEngine(beatmap, mods).judge(timeline)
@@ -0,0 +1,35 @@
+import importlib
+
+INSTALL_HINTS = {
+    'pygame': "pip install pygame",
+    'fuzzywuzzy.fuzz': "pip install fuzzywuzzy",
+    'osrparse': "pip install osrparse",
+}
+
+
+class LazyModule:
+    # stands in for a module until the first attribute access, so tools that never use a feature
+    # neither pay for importing its dependency nor need it installed
+    def __init__(self, name, feature):
+        self._name = name
+        self._feature = feature
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(self._name)
+            except ImportError as e:
+                hint = INSTALL_HINTS.get(self._name, f"pip install {self._name}")
+                raise ImportError(f"{self._feature} needs {self._name}: {hint}") from e
+        return self._module
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        # cache on the instance so hot paths skip __getattr__ after the first lookup
+        setattr(self, attr, value)
+        return value
+
+
+def lazy_import(name, feature):
+    return LazyModule(name, feature)
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from replay_stream import ReplayStream
+from timeline import ReplayTimeline
+
+# Mods.HardRock; player imports this module, so the flag cannot come from there
+HARD_ROCK = 1 << 4
+STAGES = (
+    ('replay', "Reading replay"),
+    ('lookup', "Finding beatmap"),
+    ('beatmap', "Parsing beatmap"),
+    ('frames', "Decoding frames"),
+)
+
+
+def unflip_chunk(chunk):
+    chunk.y = 384 - chunk.y
+    return chunk
+
+
+def open_timeline(stream, preload=1):
+    # stable records HardRock cursor data on the flipped playfield; unflip it once here so every view
+    # keeps cursors in map space and flips them with the objects through apply_mods.
+    # judgement works on the recorded playfield instead and reads the stream itself (see batch.py)
+    chunks = stream.chunks()
+    if stream.header.mods & HARD_ROCK:
+        chunks = map(unflip_chunk, chunks)
+    return ReplayTimeline.from_stream(chunks, preload)
+
+
+class LoadedReplay:
+    def __init__(self, osr_file, header, timeline, beatmap_path, beatmap, hit_object_store):
+        self.osr_file = osr_file
+        self.header = header
+        self.timeline = timeline
+        self.beatmap_path = beatmap_path
+        self.beatmap = beatmap
+        self.hit_object_store = hit_object_store
+
+
+class LoadJob:
+    def __init__(self, osr_file):
+        self.osr_file = osr_file
+        self.finished = set()
+        # free-form status from the running stage, e.g. beatmap index refresh progress
+        self.detail = ''
+        self.future = None
+
+    def finish(self, stage):
+        self.finished.add(stage)
+        self.detail = ''
+
+    @property
+    def progress(self):
+        return len(self.finished) / len(STAGES)
+
+    @property
+    def stages(self):
+        return [(label, name in self.finished) for name, label in STAGES]
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class ReplayLoader:
+    # find_beatmap(beatmap_hash, job) -> path or None and load_beatmap(path, mods) -> (beatmap, hit_object_store)
+    # run on worker threads, so they must not touch pygame or the caller's SQLite connections
+    def __init__(self, find_beatmap, load_beatmap, workers=2):
+        self.find_beatmap = find_beatmap
+        self.load_beatmap = load_beatmap
+        # jobs wait on their own stages, so stages get a separate pool to never starve behind waiting jobs
+        self.jobs = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='replay-loader')
+        self.stages = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='replay-loader-stage')
+
+    def load(self, osr_file, beatmap_path=None, decode_all=False):
+        job = LoadJob(osr_file)
+        job.future = self.jobs.submit(self.run, job, beatmap_path, decode_all)
+        return job
+
+    def run(self, job, beatmap_path, decode_all):
+        stream = ReplayStream(job.osr_file)
+        header = stream.header
+        job.finish('replay')
+
+        # cursor frames decode while the beatmap is found and parsed
+        frames = self.stages.submit(self.decode, job, stream, decode_all)
+        try:
+            if beatmap_path is None:
+                beatmap_path = self.find_beatmap(header.beatmap_hash, job)
+            job.finish('lookup')
+            beatmap = hit_object_store = None
+            if beatmap_path:
+                beatmap, hit_object_store = self.load_beatmap(beatmap_path, header.mods)
+            job.finish('beatmap')
+        finally:
+            timeline = frames.result()
+        return LoadedReplay(job.osr_file, header, timeline, beatmap_path, beatmap, hit_object_store)
+
+    def decode(self, job, stream, decode_all):
+        # playback only needs the first chunk to start; a prefetched replay has time to decode everything
+        timeline = open_timeline(stream)
+        if decode_all:
+            timeline.load_all()
+        job.finish('frames')
+        return timeline
+
+    def shutdown(self):
+        self.jobs.shutdown(wait=False, cancel_futures=True)
+        self.stages.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+
+CONFIG_FILE = 'osr_player_config.json'
+ENV_VAR = 'OSU_FOLDER'
+UNINSTALL_KEY = r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\osu!"
+
+
+def replays_in(osu_folder):
+    if not osu_folder:
+        return None
+    replay_folder = os.path.join(osu_folder, 'Replays')
+    return replay_folder if os.path.isdir(replay_folder) else None
+
+
+def from_config(config_file=CONFIG_FILE):
+    if not os.path.exists(config_file):
+        return None
+    try:
+        with open(config_file, 'r') as f:
+            folder = json.load(f).get('replay_folder')
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable config {config_file}: {e}")
+        return None
+    return folder if folder and os.path.isdir(folder) else None
+
+
+def from_env():
+    return replays_in(os.environ.get(ENV_VAR))
+
+
+def from_registry():
+    # only Windows installs register themselves, and winreg only exists there
+    if sys.platform != 'win32':
+        return None
+    import winreg
+    try:
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, UNINSTALL_KEY) as key:
+            return replays_in(winreg.QueryValueEx(key, "InstallLocation")[0])
+    except OSError:
+        return None
+
+
+def from_default_location():
+    # the installer's default on Windows; wine prefixes and lazer have no fixed place
+    if sys.platform != 'win32':
+        return None
+    return replays_in(os.path.join(os.environ.get('LOCALAPPDATA', ''), 'osu!'))
+
+
+# tried in order after an explicit folder; append to this list to teach discovery about other installs
+LOCATORS = [from_env, from_config, from_registry, from_default_location]
+
+
+def find_replay_folder(replay_folder=None, locators=None):
+    if replay_folder:
+        # a folder given on the command line wins, even if it turns out to be wrong
+        return replay_folder
+    for locator in LOCATORS if locators is None else locators:
+        folder = locator()
+        if folder:
+            return folder
+    return None
+
+
+def save_config(replay_folder, config_file=CONFIG_FILE):
+    with open(config_file, 'w') as f:
+        json.dump({'replay_folder': replay_folder}, f)
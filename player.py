@@ -1,12 +1,22 @@
+import argparse
 import os
-import pygame
+import threading
+from functools import partial
 import json
-from pathlib import Path
-from fuzzywuzzy import fuzz
-import winreg
-from osrparse import Replay, GameMode
-import re
 from enum import IntFlag, auto
+import numpy as np
+from lazy_import import lazy_import
+from beatmap_index import BeatmapIndex, md5_file, print_progress
+from loader import ReplayLoader
+from osu_folder import ENV_VAR, find_replay_folder, save_config
+from replay_index import ReplayIndex
+from slider_path import SliderPaths, resample_path
+from replay_stream import GameMode
+from profiler import HISTOGRAM_EDGES, PHASES, FrameProfiler, TraceWriter
+from timeline import PlaybackClock
+
+# only playback and rendering need pygame; parsing, judgement and batch analysis run without it
+pygame = lazy_import('pygame', "Replay playback")
 
 class Mods(IntFlag):
     NoMod = 0
@@ -42,139 +52,532 @@ class Mods(IntFlag):
     ScoreV2 = auto()
     Mirror = auto()
 
+    @property
+    def label(self):
+        # combined flags have no .name before Python 3.11, so spell out the single mods
+        names = [name for name, mod in type(self).__members__.items() if mod and mod in self]
+        return '|'.join(names) or 'NoMod'
+
+    @classmethod
+    def parse(cls, text):
+        # accepts full names or the usual two-letter acronyms, e.g. "HDHR" or "Hidden,HardRock"
+        mods = cls.NoMod
+        text = text.replace(',', ' ').replace('|', ' ').replace('+', ' ')
+        for word in text.split():
+            member = next((m for name, m in cls.__members__.items() if name.lower() == word.lower()), None)
+            if member is not None:
+                mods |= member
+                continue
+            if len(word) % 2:
+                raise ValueError(f"Unknown mods: {word}")
+            for i in range(0, len(word), 2):
+                acronym = word[i:i + 2].upper()
+                if acronym not in MOD_ACRONYMS:
+                    raise ValueError(f"Unknown mod: {acronym}")
+                mods |= MOD_ACRONYMS[acronym]
+        return mods
+
+MOD_ACRONYMS = {
+    'NM': Mods.NoMod, 'NF': Mods.NoFail, 'EZ': Mods.Easy, 'TD': Mods.TouchDevice, 'HD': Mods.Hidden,
+    'HR': Mods.HardRock, 'SD': Mods.SuddenDeath, 'DT': Mods.DoubleTime, 'RX': Mods.Relax, 'HT': Mods.HalfTime,
+    'NC': Mods.Nightcore, 'FL': Mods.Flashlight, 'AT': Mods.Autoplay, 'SO': Mods.SpunOut, 'AP': Mods.Relax2,
+    'PF': Mods.Perfect, 'FI': Mods.FadeIn, 'CN': Mods.Cinema, 'V2': Mods.ScoreV2, 'MR': Mods.Mirror,
+}
+
+# filter prefixes understood by select_replay, e.g. "player:someone mods:HDHR map:e130ede1 song name"
+QUERY_FILTERS = {'player': 'player', 'mods': 'mods', 'map': 'beatmap_hash'}
+
 class Button:
-    def __init__(self, x, y, width, height, text, color, text_color, font):
+    # label is rendered once by the caller; buttons are drawn every frame and their text never changes
+    def __init__(self, x, y, width, height, label, color):
         self.rect = pygame.Rect(x, y, width, height)
-        self.text = text
+        self.label = label
         self.color = color
-        self.text_color = text_color
-        self.font = font
 
     def draw(self, screen):
         pygame.draw.rect(screen, self.color, self.rect)
-        text_surf = self.font.render(self.text, True, self.text_color)
-        text_rect = text_surf.get_rect(center=self.rect.center)
-        screen.blit(text_surf, text_rect)
+        screen.blit(self.label, self.label.get_rect(center=self.rect.center))
 
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
 
+class SpriteCache:
+    APPROACH_STEPS = 32
+
+    def __init__(self):
+        self.circles = {}
+        self.approach_circles = {}
+        self.slider_bodies = {}
+        self.allocations = 0
+
+    def new_surface(self, width, height):
+        self.allocations += 1
+        return pygame.Surface((max(1, int(width)), max(1, int(height))), pygame.SRCALPHA)
+
+    def text(self, font, text, color):
+        # text changes every frame so it is not cached, but it still counts as an allocation
+        self.allocations += 1
+        return font.render(text, True, color)
+
+    def hit_circle(self, radius, color, border_color=(255, 255, 255)):
+        key = (int(radius), color, border_color)
+        surf = self.circles.get(key)
+        if surf is None:
+            r = int(radius)
+            surf = self.new_surface(r * 2, r * 2)
+            pygame.draw.circle(surf, color, (r, r), r)
+            pygame.draw.circle(surf, border_color, (r, r), r, 2)
+            self.circles[key] = surf
+        return surf
+
+    def approach_circle(self, radius, approach_rate, color=(255, 255, 255)):
+        # quantize the shrinking ring to a fixed set of scales instead of one surface per frame
+        step = round(max(0, min(1, approach_rate)) * self.APPROACH_STEPS)
+        key = (int(radius), step, color)
+        surf = self.approach_circles.get(key)
+        if surf is None:
+            r = int(radius * (1 + step / self.APPROACH_STEPS))
+            surf = self.new_surface(r * 2, r * 2)
+            pygame.draw.circle(surf, color, (r, r), r, 2)
+            self.approach_circles[key] = surf
+        return surf
+
+    def slider_body(self, key, path, scale, radius, color, border_color=(255, 255, 255)):
+        # returns the body surface and its top-left corner in screen coordinates; the path is only
+        # scaled and drawn on a miss, so sliders already on screen cost a dict lookup
+        cached = self.slider_bodies.get(key)
+        if cached is None:
+            r = int(radius)
+            # circles at most r/2 apart overlap into a solid body on any curve
+            points = resample_path(path * scale, max(1, r / 2))
+            left, top = (points.min(axis=0) - r - 1).astype(int).tolist()
+            right, bottom = (points.max(axis=0) + r + 2).tolist()
+            surf = self.new_surface(right - left, bottom - top)
+            local = (points - (left, top)).astype(int).tolist()
+            for point in local:
+                pygame.draw.circle(surf, border_color, point, r)
+            for point in local:
+                pygame.draw.circle(surf, color, point, max(1, r - 2))
+            cached = (surf, (left, top))
+            self.slider_bodies[key] = cached
+        return cached
+
+    def keep_slider_bodies(self, keys):
+        # a body can be nearly screen-sized, so only the sliders still on screen keep theirs
+        if len(self.slider_bodies) > len(keys):
+            keys = set(keys)
+            for key in [key for key in self.slider_bodies if key not in keys]:
+                del self.slider_bodies[key]
+
+    def clear_slider_bodies(self):
+        self.slider_bodies.clear()
+
+
+OBJECT_CIRCLE = 1
+OBJECT_SLIDER = 2
+OBJECT_SPINNER = 8
+OBJECT_TYPE_NAMES = {OBJECT_CIRCLE: 'circle', OBJECT_SLIDER: 'slider', OBJECT_SPINNER: 'spinner'}
+OBJECT_TYPE_CODES = {name: code for code, name in OBJECT_TYPE_NAMES.items()}
+
+
+class HitObjectArrays:
+    def __init__(self, x, y, time, end_time, type, curve_type, repeat, pixel_length, curve_offsets, curve_points):
+        self.x = x
+        self.y = y
+        self.time = time
+        self.end_time = end_time
+        self.type = type
+        self.curve_type = curve_type
+        self.repeat = repeat
+        self.pixel_length = pixel_length
+        # curve points of object i are curve_points[curve_offsets[i]:curve_offsets[i + 1]]
+        self.curve_offsets = curve_offsets
+        self.curve_points = curve_points
+
+    @classmethod
+    def from_columns(cls, x, y, time, end_time, type, curve_type, repeat, pixel_length, curve_counts, curve_points):
+        curve_offsets = np.zeros(len(curve_counts) + 1, dtype=np.int32)
+        np.cumsum(curve_counts, out=curve_offsets[1:])
+        return cls(
+            np.array(x, dtype=np.float32),
+            np.array(y, dtype=np.float32),
+            np.array(time, dtype=np.float64),
+            np.array(end_time, dtype=np.float64),
+            np.array(type, dtype=np.uint8),
+            np.array(curve_type, dtype=np.uint8),
+            np.array(repeat, dtype=np.uint16),
+            np.array(pixel_length, dtype=np.float32),
+            curve_offsets,
+            np.array(curve_points, dtype=np.float32).reshape(-1, 2),
+        )
+
+    @classmethod
+    def from_hit_objects(cls, hit_objects):
+        columns = [[] for _ in range(9)]
+        curve_points = []
+        for o in hit_objects:
+            points = o.get('curve_points', [])
+            values = (o['x'], o['y'], o['time'], o.get('end_time', o['time']),
+                      OBJECT_TYPE_CODES[o['type']],
+                      ord(o['curve_type']) if 'curve_type' in o else 0,
+                      o.get('repeat', 0), o.get('pixel_length', 0), len(points))
+            for column, value in zip(columns, values):
+                column.append(value)
+            curve_points.extend(points)
+        return cls.from_columns(*columns, curve_points)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        object_type = int(self.type[i])
+        hit_object = {'type': OBJECT_TYPE_NAMES[object_type], 'x': float(self.x[i]), 'y': float(self.y[i]),
+                      'time': float(self.time[i])}
+        if object_type == OBJECT_SLIDER:
+            hit_object['curve_type'] = chr(self.curve_type[i])
+            hit_object['curve_points'] = self.curve(i).tolist()
+            hit_object['repeat'] = int(self.repeat[i])
+            hit_object['pixel_length'] = float(self.pixel_length[i])
+        elif object_type == OBJECT_SPINNER:
+            hit_object['end_time'] = float(self.end_time[i])
+        return hit_object
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in (
+            'x', 'y', 'time', 'end_time', 'type', 'curve_type', 'repeat', 'pixel_length',
+            'curve_offsets', 'curve_points'))
+
+    def curve(self, i):
+        return self.curve_points[self.curve_offsets[i]:self.curve_offsets[i + 1]]
+
+    def take(self, order):
+        starts = self.curve_offsets[:-1][order]
+        counts = self.curve_offsets[1:][order] - starts
+        curve_offsets = np.zeros(len(order) + 1, dtype=np.int32)
+        np.cumsum(counts, out=curve_offsets[1:])
+        point_index = np.repeat(starts - curve_offsets[:-1], counts) + np.arange(curve_offsets[-1])
+        return HitObjectArrays(self.x[order], self.y[order], self.time[order], self.end_time[order],
+                               self.type[order], self.curve_type[order], self.repeat[order],
+                               self.pixel_length[order], curve_offsets, self.curve_points[point_index])
+
+    def transformed(self, apply_mods):
+        x, y, time = apply_mods(self.x, self.y, self.time)
+        end_time = apply_mods(self.x, self.y, self.end_time)[2]
+        curve_x, curve_y, _ = apply_mods(self.curve_points[:, 0], self.curve_points[:, 1], 0)
+        return HitObjectArrays(np.asarray(x, dtype=np.float32), np.asarray(y, dtype=np.float32),
+                               np.asarray(time, dtype=np.float64), np.asarray(end_time, dtype=np.float64),
+                               self.type, self.curve_type, self.repeat, self.pixel_length, self.curve_offsets,
+                               np.column_stack((curve_x, curve_y)).astype(np.float32))
+
+
+TIMING_POINT_DTYPE = np.dtype([('time', np.float64), ('beat_length', np.float64), ('meter', np.int32),
+                               ('uninherited', np.bool_)])
+KEY_VALUE_SECTIONS = ('General', 'Editor', 'Metadata', 'Difficulty', 'Colours')
+HIT_OBJECT_FIELDS = ('x', 'y', 'time', 'end_time', 'type', 'curve_type', 'repeat', 'pixel_length',
+                     'curve_offsets', 'curve_points')
+BEATMAP_CACHE_VERSION = 1
+
+
 class Beatmap:
-    def __init__(self, file_path):
+    def __init__(self, file_path, cache_dir=None):
         self.file_path = file_path
-        self.hit_objects = []
+        self.md5 = None
+        self.sections = {name: {} for name in KEY_VALUE_SECTIONS}
+        self.timing_points = np.zeros(0, dtype=TIMING_POINT_DTYPE)
+        self.hit_objects = None
+        if cache_dir:
+            self.md5 = md5_file(file_path)
+            if self.load_cache(cache_dir):
+                return
         self.parse_beatmap()
+        if cache_dir:
+            self.save_cache(cache_dir)
+
+    @property
+    def general(self):
+        return self.sections['General']
+
+    @property
+    def metadata(self):
+        return self.sections['Metadata']
+
+    def difficulty_value(self, key, default=5.0):
+        difficulty = self.sections['Difficulty']
+        if key in difficulty:
+            return float(difficulty[key])
+        # old maps without ApproachRate use OverallDifficulty for it
+        if key == 'ApproachRate' and 'OverallDifficulty' in difficulty:
+            return float(difficulty['OverallDifficulty'])
+        return default
+
+    def difficulty_for(self, mods=0):
+        cs = self.difficulty_value('CircleSize')
+        ar = self.difficulty_value('ApproachRate')
+        od = self.difficulty_value('OverallDifficulty')
+        hp = self.difficulty_value('HPDrainRate')
+        if mods & Mods.Easy:
+            cs, ar, od, hp = cs / 2, ar / 2, od / 2, hp / 2
+        elif mods & Mods.HardRock:
+            cs, ar, od, hp = min(10, cs * 1.3), min(10, ar * 1.4), min(10, od * 1.4), min(10, hp * 1.4)
+        return {'CircleSize': cs, 'ApproachRate': ar, 'OverallDifficulty': od, 'HPDrainRate': hp}
+
+    @staticmethod
+    def circle_radius(cs):
+        return 54.4 - 4.48 * cs
+
+    @staticmethod
+    def preempt(ar):
+        if ar < 5:
+            return 1200 + 600 * (5 - ar) / 5
+        return 1200 - 750 * (ar - 5) / 5
 
     def parse_beatmap(self):
-        with open(self.file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        hit_objects_section = re.search(r'\[HitObjects\]([\s\S]*)', content)
-        if hit_objects_section:
-            hit_objects_data = hit_objects_section.group(1).strip().split('\n')
-            print(f"Found {len(hit_objects_data)} hit object lines")
-            for line in hit_objects_data:
-                parts = line.split(',')
-                if len(parts) >= 4:
-                    x, y, time = map(int, parts[:3])
-                    object_type = int(parts[3])
-                    is_circle = object_type & 1
-                    is_slider = object_type & 2
-                    is_spinner = object_type & 8
-                    if is_circle:
-                        self.hit_objects.append({'type': 'circle', 'x': x, 'y': y, 'time': time})
-                    elif is_slider:
-                        curve_type = parts[5].split('|')[0]
-                        curve_points = [list(map(int, point.split(':'))) for point in parts[5].split('|')[1:]]
-                        repeat = int(parts[6])
-                        pixel_length = float(parts[7])
-                        self.hit_objects.append({'type': 'slider', 'x': x, 'y': y, 'time': time, 'curve_type': curve_type, 'curve_points': curve_points, 'repeat': repeat, 'pixel_length': pixel_length})
-                    elif is_spinner:
-                        end_time = int(parts[5])
-                        self.hit_objects.append({'type': 'spinner', 'x': x, 'y': y, 'time': time, 'end_time': end_time})
-                    print(f"Parsed object: type={object_type}, x={x}, y={y}, time={time}")
-                else:
-                    print(f"Skipped line due to insufficient parts: {line}")
-        else:
-            print("Could not find [HitObjects] section in the beatmap file")
+        section = None
+        timing_points = []
+        columns = [[] for _ in range(9)]
+        curve_points = []
+        skipped = 0
+        skipped_timing = 0
+
+        with open(self.file_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('//'):
+                    continue
+                if line[0] == '[' and line[-1] == ']':
+                    section = line[1:-1]
+                    continue
+
+                if section == 'HitObjects':
+                    parts = line.split(',')
+                    try:
+                        values = self.parse_hit_object(parts, curve_points)
+                    except (ValueError, IndexError):
+                        values = None
+                    if values is None:
+                        skipped += 1
+                        continue
+                    for column, value in zip(columns, values):
+                        column.append(value)
+                elif section == 'TimingPoints':
+                    parts = line.split(',')
+                    try:
+                        beat_length = float(parts[1])
+                        meter = int(parts[2]) if len(parts) > 2 and parts[2] else 4
+                        offset = float(parts[0])
+                    except (ValueError, IndexError):
+                        skipped_timing += 1
+                        continue
+                    uninherited = parts[6] == '1' if len(parts) > 6 else beat_length > 0
+                    timing_points.append((offset, beat_length, meter, uninherited))
+                elif section in self.sections:
+                    key, sep, value = line.partition(':')
+                    if sep:
+                        self.sections[section][key.strip()] = value.strip()
+
+        self.timing_points = np.array(timing_points, dtype=TIMING_POINT_DTYPE)
+        self.hit_objects = HitObjectArrays.from_columns(*columns, curve_points)
+        self.hit_objects.end_time[:] = self.object_end_times()
+        if skipped:
+            print(f"Skipped {skipped} malformed hit object lines in {self.file_path}")
+        if skipped_timing:
+            print(f"Skipped {skipped_timing} malformed timing point lines in {self.file_path}")
+
+    @staticmethod
+    def parse_hit_object(parts, curve_points):
+        if len(parts) < 4:
+            return None
+        x, y, time = float(parts[0]), float(parts[1]), float(parts[2])
+        object_type = int(parts[3])
+        if object_type & OBJECT_CIRCLE:
+            return x, y, time, time, OBJECT_CIRCLE, 0, 0, 0, 0
+        if object_type & OBJECT_SLIDER:
+            curve = parts[5].split('|')
+            points = [tuple(map(float, point.split(':'))) for point in curve[1:]]
+            curve_points.extend(points)
+            return x, y, time, time, OBJECT_SLIDER, ord(curve[0]), int(parts[6]), float(parts[7]), len(points)
+        if object_type & OBJECT_SPINNER:
+            return x, y, time, float(parts[5]), OBJECT_SPINNER, 0, 0, 0, 0
+        return None
+
+    def object_end_times(self):
+        objects = self.hit_objects
+        end_times = objects.end_time.copy()
+        sliders = np.flatnonzero(objects.type == OBJECT_SLIDER)
+        if len(sliders) == 0 or len(self.timing_points) == 0:
+            return end_times
+
+        points = self.timing_points[np.argsort(self.timing_points['time'], kind='stable')]
+        uninherited = points[points['uninherited']]
+        if len(uninherited) == 0:
+            return end_times
+        # an uninherited point resets slider velocity, an inherited one sets it to -100 / beat_length
+        velocity = np.where(points['uninherited'], 1.0,
+                            np.clip(-100 / np.minimum(points['beat_length'], -1e-9), 0.1, 10))
+
+        times = objects.time[sliders]
+        beat_index = np.maximum(np.searchsorted(uninherited['time'], times, side='right') - 1, 0)
+        point_index = np.searchsorted(points['time'], times, side='right') - 1
+        slider_velocity = np.where(point_index >= 0, velocity[np.maximum(point_index, 0)], 1.0)
+
+        multiplier = self.difficulty_value('SliderMultiplier', 1.4)
+        span = objects.pixel_length[sliders] / (multiplier * 100 * slider_velocity)
+        end_times[sliders] = times + span * uninherited['beat_length'][beat_index] * objects.repeat[sliders]
+        return end_times
+
+    def cache_path(self, cache_dir):
+        return os.path.join(cache_dir, f"{self.md5}.npz")
+
+    def load_cache(self, cache_dir):
+        path = self.cache_path(cache_dir)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != BEATMAP_CACHE_VERSION:
+                    return False
+                self.sections = json.loads(str(data['sections']))
+                self.timing_points = data['timing_points']
+                self.hit_objects = HitObjectArrays(*(data[name] for name in HIT_OBJECT_FIELDS))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring unreadable beatmap cache {path}: {e}")
+            return False
+        return True
+
+    def save_cache(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        arrays = {name: getattr(self.hit_objects, name) for name in HIT_OBJECT_FIELDS}
+        # write under a temporary name so a concurrent reader never sees a partial file
+        tmp_path = f"{self.cache_path(cache_dir)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=BEATMAP_CACHE_VERSION, sections=json.dumps(self.sections),
+                     timing_points=self.timing_points, **arrays)
+        os.replace(tmp_path, self.cache_path(cache_dir))
+
+def flip_for_mods(mods, x, y, time):
+    if Mods.HardRock in mods:
+        y = 384 - y  
+    if Mods.Mirror in mods:
+        x = 512 - x  
+    return x, y, time
+
+class HitObjectStore:
+    def __init__(self, hit_objects, apply_mods):
+        order = np.argsort(hit_objects.time, kind='stable')
+        self.objects = hit_objects.take(order).transformed(apply_mods)
+        self.slider_paths = SliderPaths(self.objects)
+        # running maximum keeps end times sorted so long spinners are found by binary search too
+        self.max_end_times = np.maximum.accumulate(self.objects.end_time)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def visible(self, current_time, before=200, after=1000):
+        lo = np.searchsorted(self.max_end_times, current_time - before, side='right')
+        hi = np.searchsorted(self.objects.time, current_time + after, side='left')
+        candidates = np.arange(lo, hi)
+        return candidates[self.objects.end_time[lo:hi] > current_time - before]
 
-        print(f"Parsed {len(self.hit_objects)} hit objects")
-        if len(self.hit_objects) > 0:
-            print(f"First hit object: {self.hit_objects[0]}")
-            print(f"Last hit object: {self.hit_objects[-1]}")
-        else:
-            print("No hit objects were parsed")
 
 class OSRPlayer:
-    def __init__(self, display_width=800, display_height=600):
+    def __init__(self, display_width=800, display_height=600, replay_folder=None, interactive=True):
         self.display_width = display_width
         self.display_height = display_height
         self.osu_width = 512
         self.osu_height = 384
         self.scale_x = self.display_width / self.osu_width
         self.scale_y = self.display_height / self.osu_height
-        self.replay_folder = self.get_replay_folder()
-        self.replay_files = self.get_replay_files()
+        # headless tools pass interactive=False so nothing ever waits on input()
+        self.interactive = interactive
+        self.replay_folder = self.get_replay_folder(replay_folder)
+        self.replay_index = None
+        self.listed_replays = []
         self.replay = None
+        self.timeline = None
         self.beatmap = None
+        self.hit_object_store = None
+        self.circle_radius = 25
+        self.sprites = SpriteCache()
+        self.preempt = 1000
+        self.beatmap_index = None
         self.active_mods = Mods.NoMod
         self.mod_buttons = []
         self.font = None
+        self.profiler = None
+        self.loader = None
+        self.screen = None
+        self.clock = None
 
-    def get_replay_folder(self):
-        config_file = 'osr_player_config.json'
-        if os.path.exists(config_file):
-            with open(config_file, 'r') as f:
-                config = json.load(f)
-                return config.get('replay_folder')
-
-        try:
-            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\osu!") as key:
-                osu_path = winreg.QueryValueEx(key, "InstallLocation")[0]
-                replay_folder = os.path.join(osu_path, "Replays")
-                if os.path.exists(replay_folder):
-                    self.save_config(replay_folder)
-                    return replay_folder
-        except WindowsError:
-            pass
+    def get_replay_folder(self, replay_folder=None):
+        folder = find_replay_folder(replay_folder)
+        if folder or not self.interactive:
+            return folder
 
         while True:
             folder = input("Enter the path to your osu! replay folder: ").strip()
             if os.path.exists(folder):
-                self.save_config(folder)
+                save_config(folder)
                 return folder
             print("Invalid folder path. Please try again.")
 
-    def save_config(self, replay_folder):
-        config = {'replay_folder': replay_folder}
-        with open('osr_player_config.json', 'w') as f:
-            json.dump(config, f)
+    @property
+    def osu_folder(self):
+        return os.path.dirname(self.replay_folder) if self.replay_folder else None
 
-    def get_replay_files(self):
-        return [f for f in os.listdir(self.replay_folder) if f.endswith('.osr')]
+    def get_replay_index(self):
+        if self.replay_index is None:
+            self.replay_index = ReplayIndex(os.path.join(self.osu_folder, 'replay_index.db'))
+        # cheap when nothing changed: only the folder mtime is compared
+        added, removed = self.replay_index.refresh(self.replay_folder)
+        if added or removed:
+            print(f"Indexed {added} new or changed replays, removed {removed}")
+        return self.replay_index
 
-    def list_replays(self):
-        for i, replay in enumerate(self.replay_files, 1):
+    def list_replays(self, limit=20):
+        index = self.get_replay_index()
+        self.listed_replays = index.recent(limit)
+        print(f"{len(index)} replays, showing the {len(self.listed_replays)} newest:")
+        for i, replay in enumerate(self.listed_replays, 1):
             print(f"{i}. {replay}")
 
-    def fuzzy_match(self, query):
-        matches = []
-        for replay in self.replay_files:
-            ratio = fuzz.partial_ratio(query.lower(), replay.lower())
-            if ratio > 70:  
-                matches.append((replay, ratio))
-        return sorted(matches, key=lambda x: x[1], reverse=True)
+    def parse_query(self, choice):
+        words, filters = [], {}
+        for word in choice.split():
+            key, sep, value = word.partition(':')
+            if sep and key.lower() in QUERY_FILTERS:
+                filters[QUERY_FILTERS[key.lower()]] = Mods.parse(value) if key.lower() == 'mods' else value
+            else:
+                words.append(word)
+        return ' '.join(words), filters
+
+    def search_replays(self, choice):
+        try:
+            query, filters = self.parse_query(choice)
+        except ValueError as e:
+            print(e)
+            return []
+        return self.get_replay_index().search(query, **filters)
 
     def select_replay(self):
         self.list_replays()
         while True:
-            choice = input("Enter the number or name of the replay you want to play: ").strip()
+            choice = input("Enter the number or name of the replay you want to play "
+                           "(filters: player:NAME mods:HDHR map:HASH): ").strip()
             if choice.isdigit():
                 index = int(choice) - 1
-                if 0 <= index < len(self.replay_files):
-                    return os.path.join(self.replay_folder, self.replay_files[index])
+                if 0 <= index < len(self.listed_replays):
+                    return os.path.join(self.replay_folder, self.listed_replays[index])
             else:
-                matches = self.fuzzy_match(choice)
+                matches = self.search_replays(choice)
                 if len(matches) == 1:
                     return os.path.join(self.replay_folder, matches[0][0])
                 elif len(matches) > 1:
@@ -188,83 +591,115 @@ class OSRPlayer:
                             return os.path.join(self.replay_folder, matches[index][0])
             print("Invalid selection. Please try again.")
 
-    def load_replay(self, osr_file):
+    def get_loader(self):
+        if self.loader is None:
+            self.loader = ReplayLoader(self.locate_beatmap, self.load_beatmap)
+        return self.loader
+
+    def start_loading(self, osr_file, beatmap_path=None, decode_all=False):
+        # replay parsing, beatmap lookup and beatmap parsing run on worker threads; finish_loading collects them
+        return self.get_loader().load(osr_file, beatmap_path=beatmap_path, decode_all=decode_all)
+
+    def finish_loading(self, job):
         try:
-            self.replay = Replay.from_path(osr_file)
-            print(f"Loaded replay: {self.replay.username} - Score: {self.replay.score}")
-            print(f"Beatmap hash: {self.replay.beatmap_hash}")
+            loaded = job.result()
+        except Exception as e:
+            print(f"Error loading replay file {job.osr_file}: {str(e)}")
+            self.replay = None
+            return False
 
-            self.active_mods = Mods(self.replay.mods)
-            print(f"Mods used: {self.active_mods}")
+        self.replay = loaded.header
+        # only the header and the first chunk of frames are decoded up front; play_replay pulls the rest
+        self.timeline = loaded.timeline
+        print(f"Loaded replay: {self.replay.username} - Score: {self.replay.score}")
+        print(f"Beatmap hash: {self.replay.beatmap_hash}")
 
-            # if your reading this, FUCK YOU!!! <3
+        self.active_mods = Mods(self.replay.mods)
+        print(f"Mods used: {self.active_mods}")
 
-            beatmap_path = self.find_beatmap(self.replay.beatmap_hash)
+        # if your reading this, FUCK YOU!!! <3
+
+        beatmap_path = loaded.beatmap_path
+        if beatmap_path is None and loaded.beatmap is None and self.interactive and self.osu_folder:
+            # the workers never prompt; ask here, on the main thread
+            beatmap_path = self.ask_for_beatmap(self.replay.beatmap_hash)
             if beatmap_path:
-                print(f"Found beatmap at: {beatmap_path}")
-                self.beatmap = Beatmap(beatmap_path)
-                print(f"Loaded beatmap with {len(self.beatmap.hit_objects)} hit objects")
-            else:
-                print("Corresponding beatmap not found")
-                print("Searched in:", os.path.join(os.path.dirname(self.replay_folder), 'Songs'))
-        except Exception as e:
-            print(f"Error loading replay file {osr_file}: {str(e)}")
-            self.replay = None
+                loaded.beatmap, loaded.hit_object_store = self.load_beatmap(beatmap_path, self.active_mods)
+        self.beatmap = loaded.beatmap
+        if self.beatmap is not None:
+            print(f"Found beatmap at: {beatmap_path}")
+            print(f"Loaded beatmap with {len(self.beatmap.hit_objects)} hit objects")
+        else:
+            print("Corresponding beatmap not found")
+            if self.osu_folder:
+                print("Searched in:", os.path.join(self.osu_folder, 'Songs'))
+        self.prepare_hit_objects(loaded.hit_object_store)
+        return True
 
-    def find_beatmap(self, beatmap_hash):
-        osu_folder = os.path.dirname(self.replay_folder)
-        songs_folder = os.path.join(osu_folder, 'Songs')
+    def load_replay(self, osr_file, beatmap_path=None):
+        return self.finish_loading(self.start_loading(osr_file, beatmap_path=beatmap_path))
+
+    def load_beatmap(self, beatmap_path, mods):
+        # runs on loader threads: builds everything from its arguments and leaves player state alone
+        cache_dir = os.path.join(self.osu_folder, 'parsed_beatmaps') if self.osu_folder else None
+        beatmap = Beatmap(beatmap_path, cache_dir=cache_dir)
+        return beatmap, HitObjectStore(beatmap.hit_objects, partial(flip_for_mods, Mods(int(mods))))
+
+    def get_beatmap_index(self):
+        if self.beatmap_index is None:
+            self.beatmap_index = BeatmapIndex(os.path.join(self.osu_folder, 'beatmap_index.db'))
+        return self.beatmap_index
+
+    def locate_beatmap(self, beatmap_hash, job=None):
+        # also called from loader threads, so it opens its own index connection and never prompts
+        if self.osu_folder is None:
+            print(f"osu! folder not found; pass --replay-folder or set {ENV_VAR} to look up beatmaps")
+            return None
+        songs_folder = os.path.join(self.osu_folder, 'Songs')
         print(f"Searching for beatmap with hash: {beatmap_hash}")
-        print(f"Searching in folder: {songs_folder}")
-
-        cache_file = os.path.join(osu_folder, 'beatmap_cache.json')
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r') as f:
-                cache = json.load(f)
-                if beatmap_hash in cache:
-                    file_path = cache[beatmap_hash]
-                    if os.path.exists(file_path):
-                        print(f"Found matching beatmap in cache: {file_path}")
-                        return file_path
-
-        for root, dirs, files in os.walk(songs_folder):
-            for file in files:
-                if file.endswith('.osu'):
-                    file_path = os.path.join(root, file)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                            if beatmap_hash in content:
-                                print(f"Found matching beatmap: {file_path}")
-                                self.update_cache(beatmap_hash, file_path)
-                                return file_path
-                    except UnicodeDecodeError:
-                        try:
-                            with open(file_path, 'r', encoding='latin-1') as f:
-                                content = f.read()
-                                if beatmap_hash in content:
-                                    print(f"Found matching beatmap: {file_path}")
-                                    self.update_cache(beatmap_hash, file_path)
-                                    return file_path
-                        except Exception as e:
-                            print(f"Error reading file {file_path}: {e}")
 
+        index = BeatmapIndex(os.path.join(self.osu_folder, 'beatmap_index.db'))
+        try:
+            file_path = index.lookup(beatmap_hash)
+            if file_path:
+                print(f"Found matching beatmap in index: {file_path}")
+                return file_path
+
+            def progress(done, total, elapsed):
+                print_progress(done, total, elapsed)
+                if job is not None:
+                    job.detail = f"Indexing beatmaps: {done}/{total}"
+
+            print(f"Refreshing beatmap index for: {songs_folder}")
+            added, removed = index.refresh(songs_folder, progress=progress)
+            print(f"Indexed {added} new or changed beatmaps, removed {removed}")
+            file_path = index.lookup(beatmap_hash)
+            if file_path:
+                print(f"Found matching beatmap: {file_path}")
+            return file_path
+        finally:
+            index.close()
+
+    def ask_for_beatmap(self, beatmap_hash):
         print("Beatmap not found automatically. Would you like to specify the file location manually? (y/n)")
         if input().lower() == 'y':
-            return self.manual_beatmap_input()
+            file_path = self.manual_beatmap_input()
+            self.update_cache(beatmap_hash, file_path)
+            return file_path
         else:
             print("Beatmap not found")
             return None
 
+    def find_beatmap(self, beatmap_hash):
+        file_path = self.locate_beatmap(beatmap_hash)
+        if file_path or not self.interactive or self.osu_folder is None:
+            return file_path
+        return self.ask_for_beatmap(beatmap_hash)
+
     def update_cache(self, beatmap_hash, file_path):
-        cache_file = os.path.join(os.path.dirname(self.replay_folder), 'beatmap_cache.json')
-        cache = {}
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r') as f:
-                cache = json.load(f)
-        cache[beatmap_hash] = file_path
-        with open(cache_file, 'w') as f:
-            json.dump(cache, f)
+        index = self.get_beatmap_index()
+        if index.add(file_path) != beatmap_hash:
+            index.add_alias(beatmap_hash, file_path)
 
     def manual_beatmap_input(self):
         while True:
@@ -277,45 +712,39 @@ class OSRPlayer:
     def scale_position(self, x, y):
         return x * self.scale_x, y * self.scale_y
 
+    def blit_centered(self, screen, surf, x, y, alpha=255):
+        surf.set_alpha(alpha)
+        screen.blit(surf, (int(x - surf.get_width() / 2), int(y - surf.get_height() / 2)))
+
     def draw_hit_circle(self, screen, x, y, approach_rate=1, alpha=255):
         scaled_x, scaled_y = self.scale_position(x, y)
-        radius = 25 * self.scale_x  
-        circle_color = (255, 192, 0, alpha)
-        border_color = (255, 255, 255, alpha)
-
-        circle_surf = pygame.Surface((int(radius * 2), int(radius * 2)), pygame.SRCALPHA)
-        pygame.draw.circle(circle_surf, circle_color, (int(radius), int(radius)), int(radius))
-        pygame.draw.circle(circle_surf, border_color, (int(radius), int(radius)), int(radius), 2)
-        screen.blit(circle_surf, (int(scaled_x - radius), int(scaled_y - radius)))
-
-        approach_radius = radius * (1 + approach_rate)
-        approach_surf = pygame.Surface((int(approach_radius * 2), int(approach_radius * 2)), pygame.SRCALPHA)
-        pygame.draw.circle(approach_surf, border_color, (int(approach_radius), int(approach_radius)), int(approach_radius), 2)
-        screen.blit(approach_surf, (int(scaled_x - approach_radius), int(scaled_y - approach_radius)))
-
-    def draw_slider(self, screen, slider, approach_rate=1, alpha=255):
-        start_x, start_y = self.scale_position(slider['x'], slider['y'])
-        slider_color = (255, 192, 0, alpha)
-        border_color = (255, 255, 255, alpha)
-
-        for i in range(len(slider['curve_points']) - 1):
-            start = self.scale_position(slider['curve_points'][i][0], slider['curve_points'][i][1])
-            end = self.scale_position(slider['curve_points'][i+1][0], slider['curve_points'][i+1][1])
-            pygame.draw.line(screen, slider_color, start, end, int(25 * self.scale_x))
-
-        circle_surf = pygame.Surface((int(50 * self.scale_x), int(50 * self.scale_x)), pygame.SRCALPHA)
-        pygame.draw.circle(circle_surf, slider_color, (int(25 * self.scale_x), int(25 * self.scale_x)), int(25 * self.scale_x))
-        screen.blit(circle_surf, (int(start_x - 25 * self.scale_x), int(start_y - 25 * self.scale_x)))
-
-        approach_radius = 25 * self.scale_x * (1 + approach_rate)
-        approach_surf = pygame.Surface((int(approach_radius * 2), int(approach_radius * 2)), pygame.SRCALPHA)
-        pygame.draw.circle(approach_surf, border_color, (int(approach_radius), int(approach_radius)), int(approach_radius), 2)
-        screen.blit(approach_surf, (int(start_x - approach_radius), int(start_y - approach_radius)))
-
-    def draw_spinner(self, screen, spinner, current_time):
+        radius = self.circle_radius * self.scale_x
+        circle_color = (255, 192, 0)
+
+        self.blit_centered(screen, self.sprites.hit_circle(radius, circle_color), scaled_x, scaled_y, alpha)
+        self.blit_centered(screen, self.sprites.approach_circle(radius, approach_rate), scaled_x, scaled_y, alpha)
+
+    def draw_slider(self, screen, index, path, ball_position=None, approach_rate=1, alpha=255):
+        start_x, start_y = self.scale_position(path[0][0], path[0][1])
+        radius = self.circle_radius * self.scale_x
+        slider_color = (255, 192, 0)
+
+        if len(path) > 1:
+            body, position = self.sprites.slider_body(index, path, (self.scale_x, self.scale_y), radius, (140, 100, 20))
+            body.set_alpha(alpha)
+            screen.blit(body, position)
+
+        self.blit_centered(screen, self.sprites.hit_circle(radius, slider_color), start_x, start_y, alpha)
+        self.blit_centered(screen, self.sprites.approach_circle(radius, approach_rate), start_x, start_y, alpha)
+
+        if ball_position is not None:
+            ball_x, ball_y = self.scale_position(*ball_position)
+            pygame.draw.circle(screen, (255, 255, 255), (int(ball_x), int(ball_y)), int(radius), 2)
+
+    def draw_spinner(self, screen, start_time, end_time, current_time):
         center_x, center_y = self.scale_position(256, 192)  
         radius = min(self.display_width, self.display_height) * 0.3
-        progress = min(1, (current_time - spinner['time']) / (spinner['end_time'] - spinner['time']))
+        progress = min(1, (current_time - start_time) / max(1, end_time - start_time))
 
         pygame.draw.circle(screen, (255, 192, 0), (int(center_x), int(center_y)), int(radius), 2)
         pygame.draw.arc(screen, (255, 255, 255), (center_x - radius, center_y - radius, radius * 2, radius * 2),
@@ -328,20 +757,72 @@ class OSRPlayer:
             f"Visible Objects: {visible_objects}",
             f"Active Mods: {self.active_mods}",
         ]
+        summary = self.profiler.summary() if self.profiler else {}
+        if summary:
+            debug_info.append(f"Frame: {summary['mean_ms']:.1f}ms avg, {summary['p99_ms']:.1f}ms p99, "
+                              f"{summary['allocations_per_frame']:.1f} surfaces")
+            debug_info.append(' '.join(f"{name} {summary['phases_ms'][name]:.1f}" for name in PHASES))
         for i, info in enumerate(debug_info):
-            text_surface = font.render(info, True, debug_color)
+            text_surface = self.sprites.text(font, info, debug_color)
             screen.blit(text_surface, (10, 10 + i * 20))
+        if summary:
+            self.draw_frame_histogram(screen, 10, 20 + len(debug_info) * 20)
+
+    def draw_frame_histogram(self, screen, left, top, width=180, height=40):
+        counts = self.profiler.histogram()
+        bar_width = width // len(counts)
+        peak = max(1, counts.max())
+        for i, count in enumerate(counts):
+            bar_height = int(height * count / peak)
+            # buckets slower than a 60 Hz frame are drawn red
+            color = (0, 200, 0) if HISTOGRAM_EDGES[i + 1] <= 16.7 else (220, 60, 60)
+            pygame.draw.rect(screen, color, (left + i * bar_width, top + height - bar_height, bar_width - 2, bar_height))
+        pygame.draw.line(screen, (255, 255, 255), (left, top + height), (left + width, top + height))
+
+    def draw_key_overlay(self, screen, font, current_time):
+        for i, (name, (count, held)) in enumerate(self.timeline.key_state_at(current_time).items()):
+            rect = pygame.Rect(self.display_width - 70, 10 + i * 34, 60, 30)
+            pygame.draw.rect(screen, (255, 192, 0) if held else (60, 60, 60), rect)
+            text_surface = self.sprites.text(font, f"{name} {count}", (255, 255, 255))
+            screen.blit(text_surface, text_surface.get_rect(center=rect.center))
+
+    def timeline_bar_rect(self):
+        return pygame.Rect(0, self.display_height - 8, self.display_width, 8)
+
+    def timeline_duration(self, duration=None):
+        # while frames are still decoding the timeline only knows part of its length, which would
+        # put the bar and scrub positions in the wrong place; None means not known yet
+        if duration is None and self.timeline.complete:
+            return self.timeline.duration
+        return duration
+
+    def draw_timeline_bar(self, screen, current_time, duration=None):
+        rect = self.timeline_bar_rect()
+        duration = self.timeline_duration(duration)
+        if duration is None:
+            pygame.draw.rect(screen, (35, 35, 35), rect)
+            return
+        pygame.draw.rect(screen, (60, 60, 60), rect)
+        progress = min(1, max(0, current_time / duration)) if duration else 0
+        pygame.draw.rect(screen, (255, 192, 0), (rect.x, rect.y, int(rect.width * progress), rect.height))
+
+    def timeline_position_time(self, x, duration=None):
+        rect = self.timeline_bar_rect()
+        duration = self.timeline_duration(duration)
+        if duration is None:
+            return None
+        return min(1, max(0, (x - rect.x) / rect.width)) * duration
 
     def apply_mods(self, x, y, time):
-        if Mods.HardRock in self.active_mods:
-            y = 384 - y  
-        if Mods.Mirror in self.active_mods:
-            x = 512 - x  
-        if Mods.DoubleTime in self.active_mods:
-            time *= 2/3  
-        elif Mods.HalfTime in self.active_mods:
-            time *= 4/3  
-        return x, y, time
+        return flip_for_mods(self.active_mods, x, y, time)
+
+    def playback_speed(self):
+        # replay and beatmap times are both song time; DT/HT only change how fast it passes
+        if Mods.DoubleTime in self.active_mods or Mods.Nightcore in self.active_mods:
+            return 1.5
+        if Mods.HalfTime in self.active_mods:
+            return 0.75
+        return 1.0
 
     def create_mod_buttons(self):
         button_width = 100
@@ -353,15 +834,28 @@ class OSRPlayer:
         self.mod_buttons = []
         for i, mod in enumerate([Mods.HardRock, Mods.Hidden, Mods.DoubleTime, Mods.Mirror, Mods.HalfTime]):
             x = start_x + (button_width + button_margin) * (i % 4)
-            y = start_y - (button_height + button_margin) * (i 
-            button = Button(x, y, button_width, button_height, mod.name, (100, 100, 100), (255, 255, 255), self.font)
+            y = start_y - (button_height + button_margin) * (i // 4)
+            label = self.sprites.text(self.font, mod.name, (255, 255, 255))
+            button = Button(x, y, button_width, button_height, label, (100, 100, 100))
             self.mod_buttons.append((mod, button))
 
+    def prepare_hit_objects(self, hit_object_store=None):
+        if self.beatmap:
+            difficulty = self.beatmap.difficulty_for(self.active_mods)
+            self.circle_radius = Beatmap.circle_radius(difficulty['CircleSize'])
+            self.preempt = Beatmap.preempt(difficulty['ApproachRate'])
+            # the loader may already have built the store for the replay's own mods
+            self.hit_object_store = hit_object_store or HitObjectStore(self.beatmap.hit_objects, self.apply_mods)
+        else:
+            self.hit_object_store = None
+        self.sprites.clear_slider_bodies()
+
     def toggle_mod(self, mod):
         if mod in self.active_mods:
             self.active_mods &= ~mod
         else:
             self.active_mods |= mod
+        self.prepare_hit_objects()
 
     def handle_mod_button_click(self, pos):
         for mod, button in self.mod_buttons:
@@ -370,106 +864,229 @@ class OSRPlayer:
                 return True
         return False
 
-    def play_replay(self):
+    def render_frame(self, screen, current_time, cursor, debug=True):
+        visible_objects = 0
+        profiler = self.profiler
+        visible = ()
+        if self.hit_object_store:
+            visible = self.hit_object_store.visible(current_time, after=self.preempt)
+            self.sprites.keep_slider_bodies(visible.tolist())
+        if profiler:
+            profiler.mark('culling')
+
+        screen.fill((0, 0, 0))
+        if self.hit_object_store:
+            objects = self.hit_object_store.objects
+            slider_paths = self.hit_object_store.slider_paths
+            for i in visible:
+                time_diff = objects.time[i] - current_time
+                approach_rate = max(0, min(1, time_diff / self.preempt))
+                alpha = 255
+                if Mods.Hidden in self.active_mods:
+                    if time_diff < 0:
+                        alpha = max(0, int(255 * (1 + time_diff / 200)))
+                    else:
+                        alpha = min(255, int(255 * (1 - time_diff / self.preempt)))
+
+                object_type = objects.type[i]
+                if object_type == OBJECT_CIRCLE:
+                    self.draw_hit_circle(screen, objects.x[i], objects.y[i], approach_rate, alpha)
+                elif object_type == OBJECT_SLIDER:
+                    ball_position = None
+                    if objects.time[i] <= current_time <= objects.end_time[i]:
+                        progress = (current_time - objects.time[i]) / max(1, objects.end_time[i] - objects.time[i])
+                        ball_position = slider_paths.position_at(i, progress)
+                    self.draw_slider(screen, i, slider_paths.path(i), ball_position, approach_rate, alpha)
+                elif object_type == OBJECT_SPINNER:
+                    self.draw_spinner(screen, objects.time[i], objects.end_time[i], current_time)
+                visible_objects += 1
+
+        if cursor is not None:
+            x, y, _ = self.apply_mods(cursor[0], cursor[1], 0)
+            x, y = self.scale_position(x, y)
+            pygame.draw.circle(screen, (255, 0, 0), (int(x), int(y)), 5)
+
+        if self.timeline is not None and self.font:
+            self.draw_key_overlay(screen, self.font, current_time)
+        if profiler:
+            profiler.mark('drawing')
+        if debug:
+            self.draw_debug_info(screen, self.font, current_time, visible_objects)
+            if profiler:
+                profiler.mark('debug')
+        return visible_objects
+
+    def open_window(self):
+        if self.screen is None:
+            pygame.init()
+            self.screen = pygame.display.set_mode((self.display_width, self.display_height))
+            self.clock = pygame.time.Clock()
+            self.font = pygame.font.Font(None, 24)
+            self.create_mod_buttons()
+        return self.screen
+
+    def close_window(self):
+        if self.screen is not None:
+            pygame.quit()
+            self.screen = None
+            print("Playback window closed")
+
+    def draw_loading_screen(self, screen, job):
+        screen.fill((0, 0, 0))
+        lines = [f"Loading {os.path.basename(job.osr_file)}"]
+        lines += [f"{'done' if finished else '...':>4}  {label}" for label, finished in job.stages]
+        if job.detail:
+            lines.append(job.detail)
+        for i, line in enumerate(lines):
+            screen.blit(self.sprites.text(self.font, line, (255, 255, 255)), (40, 40 + i * 24))
+        bar = pygame.Rect(40, 60 + len(lines) * 24, self.display_width - 80, 12)
+        pygame.draw.rect(screen, (60, 60, 60), bar)
+        pygame.draw.rect(screen, (255, 192, 0), (bar.x, bar.y, int(bar.width * job.progress), bar.height))
+
+    def wait_for_loading(self, job):
+        # keeps the window responsive while the loader threads work; False if the window was closed
+        screen = self.open_window()
+        while not job.done():
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return False
+            self.draw_loading_screen(screen, job)
+            pygame.display.flip()
+            self.clock.tick(30)
+        return True
+
+    def play_playlist(self, replay_files, trace=None):
+        job = self.start_loading(replay_files[0])
+        try:
+            for i, osr_file in enumerate(replay_files):
+                if not self.wait_for_loading(job):
+                    break
+                # start on the next replay now so it is ready by the time this one ends
+                next_job = None
+                if i + 1 < len(replay_files):
+                    next_job = self.start_loading(replay_files[i + 1], decode_all=True)
+                if self.finish_loading(job) and not self.play_replay(trace=trace, keep_window=True):
+                    break
+                job = next_job
+        finally:
+            self.close_window()
+
+    def play_replay(self, trace=None, keep_window=False):
         if self.replay is None:
             print("No replay loaded.")
-            return
+            return True
 
         if self.replay.mode != GameMode.STD:
             print("This player currently only supports osu!standard mode replays.")
-            return
+            return True
 
-        pygame.init()
-        screen = pygame.display.set_mode((self.display_width, self.display_height))
-        clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 24)
-        self.create_mod_buttons()
+        screen = self.open_window()
+        clock = self.clock
 
         running = True
-        playing = True
-        frame_index = 0
-        total_frames = len(self.replay.replay_data)
-        current_time = 0
+        closed = False
+        track = f"{self.replay.username} - {self.replay.beatmap_hash}"
+        self.profiler = profiler = FrameProfiler(trace=trace, track=track)
 
-        print(f"Replay loaded with {total_frames} frames.")
-        print("Controls: DELETE to pause/resume, ESC to stop")
+        print(f"Replay loaded with {len(self.timeline)} frames decoded so far.")
+        print("Controls: DELETE to pause/resume, LEFT/RIGHT to seek 5s, HOME to restart, "
+              "click or drag the bar at the bottom to scrub, ESC to stop")
 
+        playback = PlaybackClock(speed=self.playback_speed())
+        scrubbing = False
         while running:
+            profiler.begin_frame(self.sprites.allocations)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                    closed = True
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_DELETE:
-                        playing = not playing
+                        playing = playback.toggle()
                         print("Replay paused" if not playing else "Replay resumed")
                     elif event.key == pygame.K_ESCAPE:
                         running = False
                         print("Replay stopped")
+                    elif event.key == pygame.K_LEFT:
+                        playback.seek(max(0, playback.now() - 5000))
+                    elif event.key == pygame.K_RIGHT:
+                        self.timeline.load_until(playback.now() + 5000)
+                        playback.seek(min(self.timeline.duration, playback.now() + 5000))
+                    elif event.key == pygame.K_HOME:
+                        playback.seek(0)
                 elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if self.handle_mod_button_click(event.pos):
+                    if self.timeline_bar_rect().collidepoint(event.pos):
+                        # the bar only scrubs once the whole replay is decoded and its length is known
+                        target = self.timeline_position_time(event.pos[0])
+                        if target is not None:
+                            scrubbing = True
+                            playback.seek(target)
+                    elif self.handle_mod_button_click(event.pos):
+                        playback.set_speed(self.playback_speed())
                         print(f"Active mods: {self.active_mods}")
+                elif event.type == pygame.MOUSEMOTION and scrubbing:
+                    playback.seek(self.timeline_position_time(event.pos[0]))
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    scrubbing = False
 
-            if playing and frame_index < total_frames:
-                frame = self.replay.replay_data[frame_index]
-                x, y, mod_time = self.apply_mods(frame.x, frame.y, current_time + frame.time_delta)
-                x, y = self.scale_position(x, y)
-                current_time = mod_time
-
-                screen.fill((0, 0, 0))  
-
-                visible_objects = 0
-
-                if self.beatmap:
-                    for hit_object in self.beatmap.hit_objects:
-                        obj_x, obj_y, obj_time = self.apply_mods(hit_object['x'], hit_object['y'], hit_object['time'])
-                        time_diff = obj_time - current_time
-                        if -200 < time_diff < 1000:  
-                            approach_rate = max(0, min(1, time_diff / 1000))
-                            alpha = 255
-                            if Mods.Hidden in self.active_mods:
-                                if time_diff < 0:
-                                    alpha = max(0, int(255 * (1 + time_diff / 200)))
-                                else:
-                                    alpha = min(255, int(255 * (1 - time_diff / 1000)))
-
-                            if hit_object['type'] == 'circle':
-                                self.draw_hit_circle(screen, obj_x, obj_y, approach_rate, alpha)
-                            elif hit_object['type'] == 'slider':
-                                self.draw_slider(screen, hit_object, approach_rate, alpha)
-                            elif hit_object['type'] == 'spinner':
-                                self.draw_spinner(screen, hit_object, current_time)
-                            visible_objects += 1
-
-                pygame.draw.circle(screen, (255, 0, 0), (int(x), int(y)), 5)
-
-                self.draw_debug_info(screen, self.font, current_time, visible_objects)
+            profiler.mark('events')
+            current_time = playback.now()
+            # decode ahead one chunk per frame, and block only if playback outran the decoded frames
+            self.timeline.load_until(current_time)
+            self.timeline.load_more()
+            if self.timeline.complete and current_time > self.timeline.duration and not scrubbing:
+                print("Replay finished")
+                break
+            profiler.mark('decode')
 
-                for mod, button in self.mod_buttons:
-                    button.draw(screen)
+            self.render_frame(screen, current_time, self.timeline.cursor_at(current_time))
 
-                pygame.display.flip()
+            for mod, button in self.mod_buttons:
+                button.draw(screen)
+            self.draw_timeline_bar(screen, current_time)
+            profiler.mark('drawing')
 
-                if frame_index % 100 == 0:
-                    print(f"Playing frame {frame_index}/{total_frames}, Time: {current_time:.2f}ms, Visible Objects: {visible_objects}")
+            pygame.display.flip()
+            profiler.mark('flip')
+            # frame times cover the work done, not the wait in clock.tick below
+            profiler.end_frame(self.sprites.allocations)
 
-                clock.tick(60)
-                frame_index += 1
-            elif frame_index >= total_frames:
-                print("Replay finished")
-                running = False
-            else:
-                clock.tick(30)
+            # only caps the display rate; replay time comes from the playback clock
+            clock.tick(60)
 
-        pygame.quit()
-        print("Playback window closed")
+        summary = profiler.summary()
+        if summary:
+            phases = ', '.join(f"{name} {ms:.2f}ms" for name, ms in summary['phases_ms'].items())
+            print(f"Played {summary['frames']} frames: {summary['mean_ms']:.2f}ms avg, {summary['p99_ms']:.2f}ms p99 "
+                  f"over the last {min(summary['frames'], profiler.history)} ({phases})")
+        if closed or not keep_window:
+            self.close_window()
+        return not closed
 
 if __name__ == "__main__":
-    player = OSRPlayer(display_width=1280, display_height=720)
-    while True:
-        selected_replay = player.select_replay()
-        player.load_replay(selected_replay)
-        player.play_replay()
-        play_again = input("Do you want to play another replay? (y/n): ").strip().lower()
-        if play_again != 'y':
-            break
+    parser = argparse.ArgumentParser(description="Play back osu! replays")
+    parser.add_argument('--replay-folder', help=f"osu! Replays folder (default: ${ENV_VAR}/Replays, the saved config, "
+                                                "then the Windows registry)")
+    parser.add_argument('--trace', help="write a Chrome trace of per-frame phase timings to this file")
+    parser.add_argument('replays', nargs='*', help="play these .osr files back to back instead of choosing one")
+    args = parser.parse_args()
+
+    player = OSRPlayer(display_width=1280, display_height=720, replay_folder=args.replay_folder)
+    # one trace for the whole session, so every replay played ends up in it
+    trace = TraceWriter(args.trace) if args.trace else None
+    try:
+        if args.replays:
+            player.play_playlist(args.replays, trace=trace)
+        else:
+            while True:
+                selected_replay = player.select_replay()
+                player.play_playlist([selected_replay], trace=trace)
+                play_again = input("Do you want to play another replay? (y/n): ").strip().lower()
+                if play_again != 'y':
+                    break
+    finally:
+        if trace:
+            trace.close()
+            print(f"Wrote frame trace to {trace.path}")
+    player.get_loader().shutdown()
     print("Thank you for using the OSR Replay Player!")
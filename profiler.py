@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+import numpy as np
+
+PHASES = ('events', 'decode', 'culling', 'drawing', 'debug', 'flip')
+# frame-time histogram buckets in ms; the last one collects everything slower
+HISTOGRAM_EDGES = (0, 4, 8, 12, 16.7, 20, 25, 33.3, 50, np.inf)
+
+
+class TraceWriter:
+    # one Chrome trace file for a whole session; each replay played gets its own track
+    def __init__(self, path, clock=time.perf_counter):
+        self.path = path
+        self.file = open(path, 'w')
+        self.file.write('[\n')
+        self.origin = clock()
+        self.tracks = 0
+
+    def track(self, name):
+        tid = self.tracks
+        self.tracks += 1
+        self.write({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}})
+        return tid
+
+    def event(self, tid, name, start, duration, **args):
+        # Chrome trace event format, viewable in chrome://tracing or ui.perfetto.dev
+        event = {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                 'ts': round((start - self.origin) * 1e6, 1), 'dur': round(duration * 1e6, 1)}
+        if args:
+            event['args'] = args
+        self.write(event)
+
+    def write(self, event):
+        self.file.write(json.dumps(event) + ',\n')
+
+    def close(self):
+        if self.file:
+            # the format allows a trailing comma before the closing bracket to be skipped, so end with a metadata event
+            self.file.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                                        'args': {'name': 'osr player'}}) + '\n]\n')
+            self.file.close()
+            self.file = None
+
+
+class FrameProfiler:
+    def __init__(self, history=240, trace=None, track='replay', clock=time.perf_counter):
+        self.clock = clock
+        self.history = history
+        self.phase_index = {name: i for i, name in enumerate(PHASES)}
+        # rolling window of the last `history` frames
+        self.frame_times = np.zeros(history)
+        self.phase_times = np.zeros((history, len(PHASES)))
+        self.allocations = np.zeros(history, dtype=np.int64)
+        self.frames = 0
+        self.current = np.zeros(len(PHASES))
+        self.frame_start = self.last_mark = None
+        self.allocation_count = 0
+        # a TraceWriter shared by every replay in the session, or None
+        self.trace = trace
+        self.tid = trace.track(track) if trace else None
+
+    def begin_frame(self, allocation_count=0):
+        self.frame_start = self.last_mark = self.clock()
+        self.allocation_count = allocation_count
+        self.current[:] = 0
+
+    def mark(self, phase):
+        # charge the time since the previous mark to this phase; phases may be marked more than once a frame
+        now = self.clock()
+        elapsed = now - self.last_mark
+        self.current[self.phase_index[phase]] += elapsed
+        if self.trace:
+            self.trace.event(self.tid, phase, self.last_mark, elapsed)
+        self.last_mark = now
+
+    def end_frame(self, allocation_count=0):
+        now = self.clock()
+        slot = self.frames % self.history
+        self.frame_times[slot] = (now - self.frame_start) * 1000
+        self.phase_times[slot] = self.current * 1000
+        self.allocations[slot] = allocation_count - self.allocation_count
+        if self.trace:
+            self.trace.event(self.tid, 'frame', self.frame_start, now - self.frame_start,
+                             allocations=int(self.allocations[slot]))
+        self.frames += 1
+
+    def window(self):
+        count = min(self.frames, self.history)
+        return self.frame_times[:count], self.phase_times[:count], self.allocations[:count]
+
+    def histogram(self):
+        frame_times, _, _ = self.window()
+        counts, _ = np.histogram(frame_times, bins=HISTOGRAM_EDGES)
+        return counts
+
+    def summary(self):
+        frame_times, phase_times, allocations = self.window()
+        if len(frame_times) == 0:
+            return {}
+        return {
+            'frames': self.frames,
+            'mean_ms': float(frame_times.mean()),
+            'p99_ms': float(np.percentile(frame_times, 99)),
+            'max_ms': float(frame_times.max()),
+            'phases_ms': {name: float(phase_times[:, i].mean()) for name, i in self.phase_index.items()},
+            'allocations_per_frame': float(allocations.mean()),
+        }
@@ -0,0 +1,175 @@
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# must be set before pygame initialises its video subsystem
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+
+from player import OSRPlayer
+
+
+class ImageSequenceWriter:
+    def __init__(self, folder, image_format='png'):
+        self.folder = folder
+        self.image_format = image_format
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, index, screen):
+        pygame.image.save(screen, os.path.join(self.folder, f"frame_{index:06d}.{self.image_format}"))
+
+    def close(self):
+        pass
+
+
+class RawPipeWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, index, screen):
+        self.stream.write(pygame.image.tobytes(screen, 'RGB'))
+
+    def close(self):
+        self.stream.flush()
+
+
+class FFmpegWriter(RawPipeWriter):
+    def __init__(self, path, size, fps, ffmpeg='ffmpeg'):
+        width, height = size
+        self.process = subprocess.Popen(
+            [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+             '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+             '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path],
+            stdin=subprocess.PIPE)
+        super().__init__(self.process.stdin)
+
+    def close(self):
+        self.stream.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with status {self.process.returncode}")
+
+
+def create_player(osr_file, beatmap_path, replay_folder, size):
+    pygame.init()
+    player = OSRPlayer(display_width=size[0], display_height=size[1], replay_folder=replay_folder, interactive=False)
+    player.font = pygame.font.Font(None, 24)
+    player.load_replay(osr_file, beatmap_path=beatmap_path)
+    if player.timeline is not None:
+        # the frame count depends on the full duration, so decode the whole replay up front
+        player.timeline.load_all()
+    return player
+
+
+def frame_count(player, fps):
+    if player.timeline is None or len(player.timeline) == 0:
+        return 0
+    # output frames are spaced in real time, so DT/HT change how many are needed
+    duration = player.timeline.duration / player.playback_speed()
+    return math.ceil(duration * fps / 1000) + 1
+
+
+def render_range(player, writer, fps, start, end, debug=False):
+    screen = pygame.Surface((player.display_width, player.display_height))
+    speed = player.playback_speed()
+    for index in range(start, end):
+        current_time = index * 1000 / fps * speed
+        player.render_frame(screen, current_time, player.timeline.cursor_at(current_time), debug)
+        writer.write(index, screen)
+
+
+def render_chunk(job):
+    osr_file, beatmap_path, replay_folder, size, fps, start, end, output, image_format, debug = job
+    player = create_player(osr_file, beatmap_path, replay_folder, size)
+    if image_format:
+        writer = ImageSequenceWriter(output, image_format)
+    else:
+        writer = FFmpegWriter(output, size, fps)
+    try:
+        render_range(player, writer, fps, start, end, debug)
+    finally:
+        writer.close()
+    return start, end
+
+
+def concat_segments(segments, output, ffmpeg='ffmpeg'):
+    list_file = os.path.join(os.path.dirname(segments[0]), 'segments.txt')
+    with open(list_file, 'w') as f:
+        for segment in segments:
+            f.write(f"file '{os.path.abspath(segment)}'\n")
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_file,
+                    '-c', 'copy', output], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render an osu! replay to frames or video without a display")
+    parser.add_argument('replay', help="path to the .osr file")
+    parser.add_argument('--beatmap', help="path to the .osu file (default: look it up by hash)")
+    parser.add_argument('--replay-folder', help="osu! Replays folder used for beatmap lookup")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--frames', help="write an image sequence into this folder")
+    output.add_argument('--video', help="encode to this video file with ffmpeg")
+    output.add_argument('--pipe', action='store_true', help="write raw RGB24 frames to stdout")
+    parser.add_argument('--image-format', default='png', choices=['png', 'bmp', 'tga', 'jpg'])
+    parser.add_argument('--size', default='1280x720', help="output size as WIDTHxHEIGHT")
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--jobs', type=int, default=1, help="render chunks in this many processes")
+    parser.add_argument('--debug', action='store_true', help="include the debug overlay")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    if args.pipe:
+        # keep stdout clean for frame data
+        sys.stdout = sys.stderr
+    player = create_player(args.replay, args.beatmap, args.replay_folder, size)
+    if player.replay is None:
+        sys.exit(1)
+    beatmap_path = player.beatmap.file_path if player.beatmap else None
+    total = frame_count(player, args.fps)
+    print(f"Rendering {total} frames at {args.fps} fps")
+
+    start = time.perf_counter()
+    if args.pipe or args.jobs <= 1:
+        if args.pipe:
+            writer = RawPipeWriter(sys.__stdout__.buffer)
+        elif args.frames:
+            writer = ImageSequenceWriter(args.frames, args.image_format)
+        else:
+            writer = FFmpegWriter(args.video, size, args.fps)
+        try:
+            render_range(player, writer, args.fps, 0, total, args.debug)
+        finally:
+            writer.close()
+    else:
+        chunk = math.ceil(total / args.jobs)
+        bounds = [(i, min(i + chunk, total)) for i in range(0, total, chunk)]
+        segment_dir = tempfile.mkdtemp(prefix='osr_render_') if args.video else None
+        jobs = []
+        for n, (first, last) in enumerate(bounds):
+            if args.frames:
+                chunk_output, image_format = args.frames, args.image_format
+            else:
+                chunk_output, image_format = os.path.join(segment_dir, f"segment_{n:04d}.mp4"), None
+            jobs.append((args.replay, beatmap_path, player.replay_folder, size, args.fps, first, last,
+                         chunk_output, image_format, args.debug))
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            for first, last in executor.map(render_chunk, jobs):
+                print(f"Rendered frames {first}-{last - 1}")
+        if args.video:
+            concat_segments([job[7] for job in jobs], args.video)
+            shutil.rmtree(segment_dir)
+
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {total} frames in {elapsed:.1f}s ({total / elapsed:.0f} fps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from lazy_import import lazy_import
+from replay_stream import ReplayHeader
+
+# only needed once a search gets past the prefix and trigram filters
+fuzz = lazy_import('fuzzywuzzy.fuzz', "Fuzzy replay search")
+
+MATCH_THRESHOLD = 70
+# fuzzy scoring only runs on this many of the best trigram candidates
+CANDIDATE_LIMIT = 500
+
+
+def trigrams(text):
+    # pad so that short words and word starts still produce grams
+    text = f"  {text.lower()} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def read_header(file_path):
+    with open(file_path, 'rb') as f:
+        return ReplayHeader(f)
+
+
+def print_progress(done, total, elapsed):
+    rate = done / elapsed if elapsed > 0 else 0
+    print(f"Indexed {done}/{total} replays ({rate:.0f} files/s)")
+
+
+class ReplayIndex:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS replays (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                name TEXT NOT NULL,
+                search TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                player TEXT,
+                beatmap_hash TEXT,
+                mods INTEGER NOT NULL,
+                score INTEGER NOT NULL,
+                timestamp TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS replays_search ON replays (search);
+            CREATE INDEX IF NOT EXISTS replays_player ON replays (player COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS replays_beatmap ON replays (beatmap_hash);
+            CREATE INDEX IF NOT EXISTS replays_timestamp ON replays (timestamp);
+            CREATE TABLE IF NOT EXISTS trigrams (
+                gram TEXT NOT NULL,
+                replay_id INTEGER NOT NULL,
+                PRIMARY KEY (gram, replay_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS trigrams_replay ON trigrams (replay_id);
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM replays").fetchone()[0]
+
+    def get(self, name):
+        row = self.conn.execute(
+            "SELECT path, player, beatmap_hash, mods, score, timestamp FROM replays WHERE name = ?",
+            (name,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('path', 'player', 'beatmap_hash', 'mods', 'score', 'timestamp'), row))
+
+    def scan(self, replay_folder):
+        with os.scandir(replay_folder) as entries:
+            for entry in entries:
+                if entry.name.endswith('.osr') and entry.is_file():
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, st.st_mtime, st.st_size
+
+    def refresh(self, replay_folder, force=False, batch_size=500, progress=print_progress, progress_interval=1.0):
+        # osu! only ever adds or deletes replay files, which always bumps the folder mtime
+        folder_mtime = os.stat(replay_folder).st_mtime
+        row = self.conn.execute("SELECT mtime FROM folders WHERE path = ?", (replay_folder,)).fetchone()
+        if not force and row and row[0] == folder_mtime:
+            return 0, 0
+
+        known = {path: (replay_id, mtime, size) for replay_id, path, mtime, size in
+                 self.conn.execute("SELECT id, path, mtime, size FROM replays")}
+        seen = set()
+        changed = []
+        for file_path, mtime, size in self.scan(replay_folder):
+            seen.add(file_path)
+            entry = known.get(file_path)
+            if entry is None or entry[1:] != (mtime, size):
+                changed.append((file_path, mtime, size))
+
+        folder_prefix = os.path.join(replay_folder, '')
+        removed = [entry[0] for path, entry in known.items()
+                   if path not in seen and path.startswith(folder_prefix)]
+        self._delete(removed)
+
+        added = 0
+        batch = []
+        start = last_report = time.perf_counter()
+        for done, (file_path, mtime, size) in enumerate(changed, 1):
+            try:
+                header = read_header(file_path)
+            except (OSError, ValueError, IndexError) as e:
+                print(f"Error reading replay {file_path}: {e}")
+            else:
+                batch.append((file_path, mtime, size, header))
+            if len(batch) >= batch_size:
+                added += self._write_batch(batch)
+                batch = []
+            now = time.perf_counter()
+            if progress and now - last_report >= progress_interval:
+                progress(done, len(changed), now - start)
+                last_report = now
+        added += self._write_batch(batch)
+        if progress and changed:
+            progress(len(changed), len(changed), time.perf_counter() - start)
+
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO folders (path, mtime) VALUES (?, ?)",
+                              (replay_folder, folder_mtime))
+        return added, len(removed)
+
+    def _delete(self, replay_ids):
+        rows = [(replay_id,) for replay_id in replay_ids]
+        with self.conn:
+            self.conn.executemany("DELETE FROM trigrams WHERE replay_id = ?", rows)
+            self.conn.executemany("DELETE FROM replays WHERE id = ?", rows)
+
+    def _write_batch(self, rows):
+        with self.conn:
+            for file_path, mtime, size, header in rows:
+                name = os.path.basename(file_path)
+                old = self.conn.execute("SELECT id FROM replays WHERE path = ?", (file_path,)).fetchone()
+                if old:
+                    self.conn.execute("DELETE FROM trigrams WHERE replay_id = ?", old)
+                    self.conn.execute("DELETE FROM replays WHERE id = ?", old)
+                cursor = self.conn.execute(
+                    "INSERT INTO replays (path, name, search, mtime, size, player, beatmap_hash, mods, score, "
+                    "timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (file_path, name, name.lower(), mtime, size, header.username, header.beatmap_hash,
+                     header.mods, header.score, header.timestamp.isoformat()))
+                # the player name is searchable too, even when it is not part of the filename
+                grams = trigrams(name) | trigrams(header.username or '')
+                self.conn.executemany("INSERT INTO trigrams (gram, replay_id) VALUES (?, ?)",
+                                      [(gram, cursor.lastrowid) for gram in grams])
+        return len(rows)
+
+    def _filters(self, player=None, mods=None, beatmap_hash=None):
+        clauses, params = [], []
+        if player:
+            clauses.append("player = ? COLLATE NOCASE")
+            params.append(player)
+        if mods is not None:
+            # a replay matches when it has every requested mod; asking for no mods means exactly NoMod
+            if mods:
+                clauses.append("mods & ? = ?")
+                params += [int(mods), int(mods)]
+            else:
+                clauses.append("mods = 0")
+        if beatmap_hash:
+            # allow a hash prefix, like git does for commits
+            clauses.append("beatmap_hash >= ? AND beatmap_hash < ?")
+            params += [beatmap_hash.lower(), beatmap_hash.lower() + '\uffff']
+        return clauses, params
+
+    def recent(self, limit=20, player=None, mods=None, beatmap_hash=None):
+        clauses, params = self._filters(player, mods, beatmap_hash)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return [name for name, in self.conn.execute(
+            f"SELECT name FROM replays {where} ORDER BY timestamp DESC LIMIT ?", params + [limit])]
+
+    def search(self, query, player=None, mods=None, beatmap_hash=None, limit=50, threshold=MATCH_THRESHOLD):
+        query = query.strip().lower()
+        if not query:
+            return [(name, 100) for name in self.recent(limit, player, mods, beatmap_hash)]
+        clauses, params = self._filters(player, mods, beatmap_hash)
+        where = ''.join(f" AND {clause}" for clause in clauses)
+
+        # prefix matches on the filename or player are exact hits and skip fuzzy scoring
+        matches = {name: 100 for name, in self.conn.execute(
+            f"SELECT name FROM replays WHERE ((search >= ? AND search < ?) OR "
+            f"(player >= ? COLLATE NOCASE AND player < ? COLLATE NOCASE)){where} LIMIT ?",
+            [query, query + '\uffff', query, query + '\uffff'] + params + [limit])}
+
+        grams = trigrams(query)
+        if len(query) >= 3:
+            # rank by shared trigrams so only a bounded set of candidates gets the slow fuzzy score;
+            # a typo removes at most three grams, so demand only a fraction of them
+            needed = max(1, len(grams) // 3)
+            placeholders = ','.join('?' * len(grams))
+            candidates = self.conn.execute(
+                f"SELECT r.name, r.player FROM trigrams t JOIN replays r ON r.id = t.replay_id "
+                f"WHERE t.gram IN ({placeholders}){where} GROUP BY t.replay_id HAVING COUNT(*) >= ? "
+                f"ORDER BY COUNT(*) DESC LIMIT ?",
+                list(grams) + params + [needed, CANDIDATE_LIMIT])
+        else:
+            candidates = self.conn.execute(
+                f"SELECT name, player FROM replays WHERE instr(search, ?) > 0{where} LIMIT ?",
+                [query] + params + [CANDIDATE_LIMIT])
+
+        for name, player_name in candidates:
+            if name in matches:
+                continue
+            ratio = max(fuzz.partial_ratio(query, name.lower()),
+                        fuzz.partial_ratio(query, (player_name or '').lower()))
+            if ratio > threshold:
+                matches[name] = ratio
+        return sorted(matches.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, refresh or search the replay index for an osu! Replays folder")
+    parser.add_argument('replay_folder', help="path to the osu! Replays folder")
+    parser.add_argument('query', nargs='?', default='', help="search text (default: list the newest replays)")
+    parser.add_argument('--db', help="index file (default: replay_index.db next to the Replays folder)")
+    parser.add_argument('--player', help="only replays by this player")
+    parser.add_argument('--beatmap', help="only replays of this beatmap hash (or hash prefix)")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--force', action='store_true', help="rescan even if the folder looks unchanged")
+    args = parser.parse_args()
+
+    replay_folder = os.path.abspath(args.replay_folder)
+    db_path = args.db or os.path.join(os.path.dirname(replay_folder), 'replay_index.db')
+    index = ReplayIndex(db_path)
+    start = time.perf_counter()
+    added, removed = index.refresh(replay_folder, force=args.force)
+    print(f"Indexed {added} new or changed replays, removed {removed}, "
+          f"{len(index)} total in {time.perf_counter() - start:.1f}s")
+    for name, ratio in index.search(args.query, player=args.player, beatmap_hash=args.beatmap, limit=args.limit):
+        print(f"{ratio:3d}  {name}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
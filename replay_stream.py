@@ -0,0 +1,133 @@
+import lzma
+import struct
+from datetime import datetime, timedelta, timezone
+from enum import IntEnum
+
+import numpy as np
+
+READ_SIZE = 1 << 16
+CHUNK_FRAMES = 8192
+RNG_SEED_DELTA = -12345
+
+
+# same names and values as osrparse.GameMode, without importing osrparse just to read a header
+class GameMode(IntEnum):
+    STD = 0
+    TAIKO = 1
+    CTB = 2
+    MANIA = 3
+
+
+def read_uleb128(f):
+    result = 0
+    shift = 0
+    while True:
+        byte = f.read(1)[0]
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result
+        shift += 7
+
+
+def read_string(f):
+    marker = f.read(1)[0]
+    if marker == 0x00:
+        return None
+    if marker != 0x0b:
+        raise ValueError(f"Expected the first byte of a string to be 0x00 or 0x0b, but got {marker}")
+    return f.read(read_uleb128(f)).decode('utf-8')
+
+
+def read_struct(f, specifier):
+    return struct.unpack(specifier, f.read(struct.calcsize(specifier)))
+
+
+class ReplayHeader:
+    def __init__(self, f):
+        # field names match osrparse.Replay so the header can stand in for it
+        self.mode = GameMode(read_struct(f, '<B')[0])
+        self.game_version = read_struct(f, '<I')[0]
+        self.beatmap_hash = read_string(f)
+        self.username = read_string(f)
+        self.replay_hash = read_string(f)
+        (self.count_300, self.count_100, self.count_50, self.count_geki, self.count_katu,
+         self.count_miss) = read_struct(f, '<6H')
+        self.score, self.max_combo, self.perfect, self.mods = read_struct(f, '<IHBI')
+        self.life_bar_graph = read_string(f)
+        ticks = read_struct(f, '<q')[0]
+        self.timestamp = (datetime.min + timedelta(microseconds=ticks / 10)).replace(tzinfo=timezone.utc)
+        self.data_length = read_struct(f, '<I')[0]
+        self.data_offset = f.tell()
+
+
+class ReplayChunk:
+    def __init__(self, time_delta, x, y, keys):
+        self.time_delta = time_delta
+        self.x = x
+        self.y = y
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.time_delta)
+
+
+class ReplayStream:
+    def __init__(self, path, chunk_frames=CHUNK_FRAMES):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        with open(path, 'rb') as f:
+            self.header = ReplayHeader(f)
+
+    def __iter__(self):
+        return self.chunks()
+
+    def chunks(self):
+        decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_AUTO)
+        remaining = self.header.data_length
+        pending = ''
+        frames_seen = 0
+        buffered = []
+        buffered_frames = 0
+        with open(self.path, 'rb') as f:
+            f.seek(self.header.data_offset)
+            while remaining > 0 and not decompressor.eof:
+                block = f.read(min(READ_SIZE, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                text = pending + decompressor.decompress(block).decode('ascii')
+                # the last event may be cut in half; keep it for the next block
+                complete, _, pending = text.rpartition(',')
+                if not complete:
+                    pending = text
+                    continue
+                frames = self.parse_frames(complete, frames_seen)
+                frames_seen += complete.count(',') + 1
+                buffered.append(frames)
+                buffered_frames += len(frames)
+                if buffered_frames >= self.chunk_frames:
+                    yield self.to_chunk(np.concatenate(buffered))
+                    buffered, buffered_frames = [], 0
+
+        if pending.strip():
+            buffered.append(self.parse_frames(pending, frames_seen))
+        if buffered:
+            frames = np.concatenate(buffered)
+            if len(frames):
+                yield self.to_chunk(frames)
+
+    @staticmethod
+    def parse_frames(text, frames_seen):
+        values = np.array(text.replace('|', ',').split(','), dtype=np.float64).reshape(-1, 4)
+        keep = values[:, 0] != RNG_SEED_DELTA
+        # the first two frames of stable replays are placeholders at (256, -500)
+        head = max(0, 2 - frames_seen)
+        if head:
+            placeholder = (values[:head, 1] == 256) & (values[:head, 2] == -500)
+            keep[:head] &= ~placeholder
+        return values[keep]
+
+    @staticmethod
+    def to_chunk(frames):
+        return ReplayChunk(frames[:, 0], frames[:, 1].astype(np.float32), frames[:, 2].astype(np.float32),
+                           frames[:, 3].astype(np.int32))
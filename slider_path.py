@@ -0,0 +1,174 @@
+from math import comb
+
+import numpy as np
+
+CURVE_BEZIER = ord('B')
+CURVE_PERFECT = ord('P')
+CURVE_CATMULL = ord('C')
+CURVE_LINEAR = ord('L')
+
+CATMULL_DETAIL = 50
+BEZIER_SPACING = 4.0
+
+
+def bezier_segment(points):
+    # sample roughly every BEZIER_SPACING osu!pixels along the control polygon
+    polygon_length = np.linalg.norm(np.diff(points, axis=0), axis=1).sum()
+    samples = int(np.clip(polygon_length / BEZIER_SPACING, 2, 500))
+    n = len(points) - 1
+    t = np.linspace(0, 1, samples)[:, None]
+    i = np.arange(n + 1)
+    binomials = np.array([comb(n, k) for k in i], dtype=np.float64)
+    basis = binomials * t ** i * (1 - t) ** (n - i)
+    return basis @ points
+
+
+def bezier_path(points):
+    # a repeated control point ("red anchor") starts a new bezier segment
+    splits = np.flatnonzero(np.all(points[1:] == points[:-1], axis=1)) + 1
+    segments = []
+    start = 0
+    for split in list(splits) + [len(points)]:
+        segment = points[start:split]
+        if len(segment) >= 2:
+            segments.append(bezier_segment(segment))
+        start = split
+    if not segments:
+        return points[:1]
+    return np.concatenate(segments)
+
+
+def perfect_circle_path(points):
+    a, b, c = points
+    d = 2 * (a[0] * (b[1] - c[1]) + b[0] * (c[1] - a[1]) + c[0] * (a[1] - b[1]))
+    if abs(d) < 1e-3:
+        return bezier_path(points)
+
+    sq = (a ** 2).sum(), (b ** 2).sum(), (c ** 2).sum()
+    center = np.array([
+        (sq[0] * (b[1] - c[1]) + sq[1] * (c[1] - a[1]) + sq[2] * (a[1] - b[1])) / d,
+        (sq[0] * (c[0] - b[0]) + sq[1] * (a[0] - c[0]) + sq[2] * (b[0] - a[0])) / d,
+    ])
+    radius = np.linalg.norm(a - center)
+    start_angle = np.arctan2(a[1] - center[1], a[0] - center[0])
+    end_angle = np.arctan2(c[1] - center[1], c[0] - center[0])
+
+    # walk from a to c in the direction that passes through b
+    clockwise = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0]) < 0
+    if clockwise:
+        while end_angle > start_angle:
+            end_angle -= 2 * np.pi
+    else:
+        while end_angle < start_angle:
+            end_angle += 2 * np.pi
+
+    samples = int(np.clip(abs(end_angle - start_angle) * radius / BEZIER_SPACING, 2, 500))
+    angles = np.linspace(start_angle, end_angle, samples)
+    return center + radius * np.column_stack((np.cos(angles), np.sin(angles)))
+
+
+def catmull_path(points):
+    if len(points) < 2:
+        return points
+    v1 = points[:-1]
+    v2 = points[1:]
+    v0 = np.concatenate((v1[:1], points[:-2]))
+    v3 = np.concatenate((points[2:], v2[-1:] * 2 - v1[-1:]))
+
+    t = np.linspace(0, 1, CATMULL_DETAIL, endpoint=False)[None, :, None]
+    v0, v1, v2, v3 = (v[:, None, :] for v in (v0, v1, v2, v3))
+    segment = 0.5 * (2 * v1 + (-v0 + v2) * t + (2 * v0 - 5 * v1 + 4 * v2 - v3) * t ** 2
+                     + (-v0 + 3 * v1 - 3 * v2 + v3) * t ** 3)
+    return np.concatenate((segment.reshape(-1, 2), points[-1:]))
+
+
+def curve_path(curve_type, points):
+    if curve_type == CURVE_LINEAR:
+        return points
+    if curve_type == CURVE_PERFECT and len(points) == 3:
+        return perfect_circle_path(points)
+    if curve_type == CURVE_CATMULL:
+        return catmull_path(points)
+    return bezier_path(points)
+
+
+def clip_path(path, length):
+    # cut or extend the polyline so it is exactly `length` osu!pixels long
+    distances = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))))
+    if length <= 0 or len(path) < 2:
+        return path, distances
+
+    end = np.searchsorted(distances, length)
+    if end < len(path):
+        path = path[:end + 1].copy()
+        distances = distances[:end + 1].copy()
+    else:
+        # too short: extend along the last segment, as osu! does
+        path = path.copy()
+        distances = distances.copy()
+        end = len(path) - 1
+    segment = distances[end] - distances[end - 1]
+    if segment > 0:
+        t = (length - distances[end - 1]) / segment
+        path[end] = path[end - 1] + (path[end] - path[end - 1]) * t
+    distances[end] = length
+    return path, distances
+
+
+def resample_path(path, spacing):
+    # evenly spaced points along the polyline; linear sliders keep only their control points and
+    # clip_path can stretch the last segment, so stamping circles on the raw vertices leaves gaps
+    if len(path) < 2:
+        return path
+    distances = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))))
+    steps = np.linspace(0, distances[-1], max(2, int(np.ceil(distances[-1] / spacing)) + 1))
+    return np.column_stack((np.interp(steps, distances, path[:, 0]), np.interp(steps, distances, path[:, 1])))
+
+
+class SliderPaths:
+    def __init__(self, hit_objects):
+        counts = np.zeros(len(hit_objects), dtype=np.int32)
+        paths = []
+        distances = []
+        # only sliders carry a curve type
+        for i in np.flatnonzero(hit_objects.curve_type):
+            start = np.array([[hit_objects.x[i], hit_objects.y[i]]], dtype=np.float64)
+            control = np.concatenate((start, hit_objects.curve(i).astype(np.float64)))
+            path, path_distances = clip_path(curve_path(hit_objects.curve_type[i], control),
+                                             float(hit_objects.pixel_length[i]))
+            counts[i] = len(path)
+            paths.append(path)
+            distances.append(path_distances)
+
+        # path of object i is points[offsets[i]:offsets[i + 1]]
+        self.offsets = np.zeros(len(hit_objects) + 1, dtype=np.int32)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.points = np.concatenate(paths).astype(np.float32) if paths else np.zeros((0, 2), dtype=np.float32)
+        self.distances = np.concatenate(distances).astype(np.float32) if distances else np.zeros(0, dtype=np.float32)
+        self.repeat = hit_objects.repeat
+
+    def path(self, i):
+        return self.points[self.offsets[i]:self.offsets[i + 1]]
+
+    def length(self, i):
+        end = self.offsets[i + 1]
+        return float(self.distances[end - 1]) if end > self.offsets[i] else 0.0
+
+    def position_at(self, i, progress):
+        # progress runs from 0 to 1 over the whole slider, repeats included
+        path = self.path(i)
+        if len(path) == 0:
+            return None
+        distances = self.distances[self.offsets[i]:self.offsets[i + 1]]
+        repeat = max(1, int(self.repeat[i]))
+        span = np.clip(progress, 0, 1) * repeat
+        span_index = np.minimum(np.floor(span), repeat - 1)
+        t = span - span_index
+        t = np.where(span_index % 2 == 1, 1 - t, t)
+        distance = t * distances[-1]
+        x = np.interp(distance, distances, path[:, 0])
+        y = np.interp(distance, distances, path[:, 1])
+        return x, y
+
+    def end_position(self, i):
+        return self.position_at(i, 1.0)
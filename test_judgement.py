@@ -0,0 +1,184 @@
+import numpy as np
+
+from judgement import HIT_50, HIT_100, HIT_300, MISS, JudgementEngine, spins_per_second
+from player import Beatmap, Mods, OBJECT_CIRCLE, OBJECT_SLIDER, OBJECT_SPINNER
+from timeline import ReplayTimeline
+
+BEATMAP = """osu file format v14
+
+[General]
+Mode: 0
+
+[Difficulty]
+HPDrainRate:5
+CircleSize:4
+OverallDifficulty:8
+ApproachRate:9
+SliderMultiplier:1.8
+SliderTickRate:1
+
+[TimingPoints]
+0,300,4,2,0,60,1,0
+6000,-50,4,2,0,60,0,0
+
+[HitObjects]
+100,100,1000,1,0,0:0:0:0:
+400,300,1300,1,0,0:0:0:0:
+60,320,1450,1,0,0:0:0:0:
+100,200,2000,2,0,L|300:200,1,180
+300,100,3000,2,0,B|350:150|300:250|400:300,3,200
+200,300,5000,2,0,P|250:200|350:320,2,150
+256,192,7000,12,0,9000,0:0:0:0:
+480,40,9400,1,0,0:0:0:0:
+20,360,9550,5,0,0:0:0:0:
+256,192,11000,1,0,0:0:0:0:
+256,192,11100,1,0,0:0:0:0:
+"""
+
+KEY_DOWN = 5  # K1, which also sets M1
+SAMPLE_MS = 10
+
+
+def perfect_replay(engine, spin_rate=10):
+    # press every object exactly on time, follow every slider ball and spin spinners at spin_rate turns a second
+    objects = engine.objects
+    frames = []
+    for i in range(len(objects)):
+        start, end = float(objects.time[i]), float(objects.end_time[i])
+        if objects.type[i] == OBJECT_SLIDER:
+            samples = np.arange(start, end + SAMPLE_MS, SAMPLE_MS)
+            x, y = engine.slider_paths.position_at(i, np.clip((samples - start) / (end - start), 0, 1))
+            frames += [(t, px, py, KEY_DOWN) for t, px, py in zip(samples, x, y)]
+            frames.append((end + SAMPLE_MS, x[-1], y[-1], 0))
+        elif objects.type[i] == OBJECT_SPINNER:
+            samples = np.arange(start, end + SAMPLE_MS, SAMPLE_MS)
+            angle = (samples - start) / 1000 * spin_rate * 2 * np.pi
+            frames += [(t, 256 + 60 * np.cos(a), 192 + 60 * np.sin(a), KEY_DOWN) for t, a in zip(samples, angle)]
+            frames.append((end + SAMPLE_MS, 256, 192, 0))
+        else:
+            x, y = float(objects.x[i]), float(objects.y[i])
+            frames += [(start - SAMPLE_MS, x, y, 0), (start, x, y, KEY_DOWN), (start + SAMPLE_MS, x, y, 0)]
+
+    times, x, y, keys = (np.array(column) for column in zip(*frames))
+    timeline = ReplayTimeline()
+    timeline.extend(np.diff(times, prepend=0.0), x.astype(np.float32), y.astype(np.float32), keys.astype(np.int32))
+    return timeline
+
+
+def load_beatmap(tmp_path):
+    path = tmp_path / 'test.osu'
+    path.write_text(BEATMAP)
+    return Beatmap(str(path))
+
+
+def test_map_covers_every_object_kind(tmp_path):
+    beatmap = load_beatmap(tmp_path)
+    assert set(beatmap.hit_objects.type.tolist()) == {OBJECT_CIRCLE, OBJECT_SLIDER, OBJECT_SPINNER}
+    assert beatmap.hit_objects.repeat.max() == 3
+
+
+def test_perfect_replay_scores_all_300s(tmp_path):
+    beatmap = load_beatmap(tmp_path)
+    for mods in (Mods.NoMod, Mods.HardRock, Mods.DoubleTime, Mods.Easy):
+        engine = JudgementEngine(beatmap, mods)
+        result = engine.judge(perfect_replay(engine))
+        assert result.counts[HIT_300] == len(beatmap.hit_objects), (mods, result.result)
+        # every object gives a point, and each slider one more per repeat and for its end
+        assert result.max_combo == len(beatmap.hit_objects) + int(beatmap.hit_objects.repeat.sum())
+        assert result.accuracy == 1.0
+        assert np.nanmax(np.abs(result.hit_error)) == 0
+
+
+def test_late_and_missed_presses_are_penalised(tmp_path):
+    beatmap = load_beatmap(tmp_path)
+    engine = JudgementEngine(beatmap)
+    timeline = perfect_replay(engine)
+    w300, w100, w50 = engine.windows
+    circles = np.flatnonzero(engine.objects.type == OBJECT_CIRCLE)
+    times = timeline.times
+    keys = timeline.keys.copy()
+
+    # press the first circle past its 300 window, and miss the second one completely
+    first_press = np.flatnonzero(times == engine.objects.time[circles[0]])[0]
+    late = ReplayTimeline()
+    delta = np.diff(times, prepend=0.0)
+    delta[first_press] += w300 + 5
+    delta[first_press + 1] -= w300 + 5
+    keys[np.flatnonzero(times == engine.objects.time[circles[1]])] = 0
+    late.extend(delta, timeline.x, timeline.y, keys)
+    result = engine.judge(late)
+    assert result.result[circles[0]] == HIT_100
+    assert result.result[circles[1]] == MISS
+    assert result.combo[circles[1]] == 0
+
+
+def test_dropped_slider_end_keeps_combo_but_costs_accuracy(tmp_path):
+    beatmap = load_beatmap(tmp_path)
+    engine = JudgementEngine(beatmap)
+    timeline = perfect_replay(engine)
+    perfect = engine.judge(timeline)
+    slider = np.flatnonzero((engine.objects.type == OBJECT_SLIDER) & (engine.objects.repeat == 1))[0]
+    start, end = engine.objects.time[slider], engine.objects.end_time[slider]
+
+    # let go of the key halfway through the slider
+    keys = timeline.keys.copy()
+    keys[(timeline.times > (start + end) / 2) & (timeline.times <= end)] = 0
+    released = ReplayTimeline()
+    released.extend(np.diff(timeline.times, prepend=0.0), timeline.x, timeline.y, keys)
+    result = engine.judge(released)
+    assert result.result[slider] == HIT_100
+    # only the end's own point is lost; the combo carries on into the next object
+    assert result.combo[slider] == perfect.combo[slider] - 1
+    assert result.combo[slider + 1] == perfect.combo[slider + 1] - 1
+    assert result.max_combo == perfect.max_combo - 1
+
+
+def test_dropped_slider_repeat_breaks_combo(tmp_path):
+    beatmap = load_beatmap(tmp_path)
+    engine = JudgementEngine(beatmap)
+    timeline = perfect_replay(engine)
+    slider = np.flatnonzero(engine.objects.repeat == 3)[0]
+    start, end = engine.objects.time[slider], engine.objects.end_time[slider]
+    first_repeat = start + (end - start) / 3
+
+    # release just before the first repeat and press again right after it
+    keys = timeline.keys.copy()
+    keys[(timeline.times > first_repeat - 30) & (timeline.times <= first_repeat + 20)] = 0
+    dropped = ReplayTimeline()
+    dropped.extend(np.diff(timeline.times, prepend=0.0), timeline.x, timeline.y, keys)
+    result = engine.judge(dropped)
+    assert result.result[slider] == HIT_100
+    # the combo restarts after the repeat: the second repeat and the end are the slider's points
+    assert result.combo[slider] == 2
+    assert result.combo[slider + 1] == 2 + 1 + engine.objects.repeat[slider + 1]
+
+
+def test_one_press_judges_only_one_stacked_circle(tmp_path):
+    beatmap = load_beatmap(tmp_path)
+    engine = JudgementEngine(beatmap)
+    timeline = perfect_replay(engine)
+    stacked = np.flatnonzero(engine.objects.time == 11100)[0]
+    assert engine.objects.time[stacked] - engine.objects.time[stacked - 1] < engine.windows[2]
+
+    # without its own press the second circle of the stack is a miss, even though the first press is in its window
+    keys = timeline.keys.copy()
+    keys[timeline.times == 11100] = 0
+    single = ReplayTimeline()
+    single.extend(np.diff(timeline.times, prepend=0.0), timeline.x, timeline.y, keys)
+    result = engine.judge(single)
+    assert result.result[stacked - 1] == HIT_300
+    assert result.result[stacked] == MISS
+
+
+def test_spinner_needs_enough_rotations(tmp_path):
+    beatmap = load_beatmap(tmp_path)
+    engine = JudgementEngine(beatmap)
+    spinner = np.flatnonzero(engine.objects.type == OBJECT_SPINNER)[0]
+    seconds = (engine.objects.end_time[spinner] - engine.objects.time[spinner]) / 1000
+    # OD8 asks for 6.5 spins a second, so 13 over the two second spinner
+    required = np.floor(seconds * spins_per_second(engine.od))
+    assert required == 13
+
+    assert engine.judge(perfect_replay(engine, (required + 0.5) / seconds)).result[spinner] == HIT_300
+    assert engine.judge(perfect_replay(engine, (required - 0.5) / seconds)).result[spinner] == HIT_100
+    assert engine.judge(perfect_replay(engine, required * 0.3 / seconds)).result[spinner] == HIT_50
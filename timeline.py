@@ -0,0 +1,235 @@
+import time
+
+import numpy as np
+
+# K1/K2 also set the M1/M2 bit, so the mouse buttons only count when their key bit is clear
+KEY_BUTTONS = (('K1', 4, 0), ('K2', 8, 0), ('M1', 1, 4), ('M2', 2, 8))
+
+
+class PlaybackClock:
+    def __init__(self, speed=1.0, start_time=0.0, clock=time.perf_counter):
+        self.clock = clock
+        self.speed = speed
+        self.playing = True
+        self.anchor_time = start_time
+        self.anchor_clock = clock()
+
+    def now(self):
+        if not self.playing:
+            return self.anchor_time
+        return self.anchor_time + (self.clock() - self.anchor_clock) * 1000 * self.speed
+
+    def seek(self, replay_time):
+        self.anchor_time = replay_time
+        self.anchor_clock = self.clock()
+
+    def set_speed(self, speed):
+        # re-anchor first so changing speed never makes the timeline jump
+        self.seek(self.now())
+        self.speed = speed
+
+    def pause(self):
+        self.seek(self.now())
+        self.playing = False
+
+    def resume(self):
+        self.anchor_clock = self.clock()
+        self.playing = True
+
+    def toggle(self):
+        if self.playing:
+            self.pause()
+        else:
+            self.resume()
+        return self.playing
+
+
+class ReplayTimeline:
+    COLUMNS = (('times', np.float64), ('search_times', np.float64), ('x', np.float32), ('y', np.float32),
+               ('keys', np.int32))
+
+    def __init__(self, replay_data=()):
+        self.length = 0
+        self.buffers = {name: np.zeros(0, dtype=dtype) for name, dtype in self.COLUMNS}
+        self.press_buffers = {name: np.zeros(0, dtype=np.int32) for name, _, _ in KEY_BUTTONS}
+        # chunk iterator that is still being decoded, or None once every frame is loaded
+        self.stream = None
+        if len(replay_data):
+            count = len(replay_data)
+            self.extend(np.fromiter((frame.time_delta for frame in replay_data), dtype=np.float64, count=count),
+                        np.fromiter((frame.x for frame in replay_data), dtype=np.float32, count=count),
+                        np.fromiter((frame.y for frame in replay_data), dtype=np.float32, count=count),
+                        np.fromiter((int(frame.keys) for frame in replay_data), dtype=np.int32, count=count))
+
+    @classmethod
+    def from_stream(cls, chunks, preload=1):
+        timeline = cls()
+        timeline.stream = iter(chunks)
+        timeline.load_more(preload)
+        return timeline
+
+    @property
+    def complete(self):
+        return self.stream is None
+
+    def load_more(self, chunks=1):
+        for _ in range(chunks):
+            if self.stream is None:
+                return
+            chunk = next(self.stream, None)
+            if chunk is None:
+                self.stream = None
+                return
+            self.extend(chunk.time_delta, chunk.x, chunk.y, chunk.keys)
+
+    def load_until(self, replay_time):
+        while self.stream is not None and self.duration <= replay_time:
+            self.load_more()
+
+    def load_all(self):
+        while self.stream is not None:
+            self.load_more()
+
+    def reserve(self, size):
+        capacity = len(self.buffers['times'])
+        if size <= capacity:
+            return
+        # grow geometrically so appending chunks stays linear overall
+        capacity = max(size, capacity * 2, 1024)
+        for group in (self.buffers, self.press_buffers):
+            for name, buffer in group.items():
+                grown = np.zeros(capacity, dtype=buffer.dtype)
+                grown[:self.length] = buffer[:self.length]
+                group[name] = grown
+
+    def extend(self, time_delta, x, y, keys):
+        count = len(time_delta)
+        if count == 0:
+            return
+        start, end = self.length, self.length + count
+        last_time = self.times[-1] if start else 0.0
+        last_max = self.search_times[-1] if start else -np.inf
+        last_keys = int(self.keys[-1]) if start else 0
+        self.reserve(end)
+
+        times = last_time + np.cumsum(time_delta, dtype=np.float64)
+        self.buffers['times'][start:end] = times
+        # a few frames step backwards in time; search over the running maximum so bisection stays valid
+        self.buffers['search_times'][start:end] = np.maximum(np.maximum.accumulate(times), last_max)
+        self.buffers['x'][start:end] = x
+        self.buffers['y'][start:end] = y
+        self.buffers['keys'][start:end] = keys
+
+        # prefix sums of press transitions: the key counter state at every frame, found by bisection
+        previous_keys = np.concatenate(([last_keys], keys[:-1]))
+        for name, bit, exclude in KEY_BUTTONS:
+            held = ((keys & bit) != 0) & ((keys & exclude) == 0)
+            was_held = ((previous_keys & bit) != 0) & ((previous_keys & exclude) == 0)
+            last_count = self.press_buffers[name][start - 1] if start else 0
+            self.press_buffers[name][start:end] = last_count + np.cumsum(held & ~was_held, dtype=np.int32)
+        self.length = end
+
+    @property
+    def times(self):
+        return self.buffers['times'][:self.length]
+
+    @property
+    def search_times(self):
+        return self.buffers['search_times'][:self.length]
+
+    @property
+    def x(self):
+        return self.buffers['x'][:self.length]
+
+    @property
+    def y(self):
+        return self.buffers['y'][:self.length]
+
+    @property
+    def keys(self):
+        return self.buffers['keys'][:self.length]
+
+    @property
+    def press_counts(self):
+        return {name: buffer[:self.length] for name, buffer in self.press_buffers.items()}
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def duration(self):
+        return float(self.search_times[-1]) if len(self.search_times) else 0.0
+
+    def frame_at(self, replay_time):
+        return max(0, int(np.searchsorted(self.search_times, replay_time, side='right')) - 1)
+
+    def key_state_at(self, replay_time):
+        if len(self.times) == 0:
+            return {name: (0, False) for name, _, _ in KEY_BUTTONS}
+        index = self.frame_at(replay_time)
+        keys = self.keys[index]
+        return {name: (int(self.press_counts[name][index]), bool(keys & bit) and not keys & exclude)
+                for name, bit, exclude in KEY_BUTTONS}
+
+    def cursor_at(self, replay_time):
+        if len(self.times) == 0:
+            return 0.0, 0.0
+        index = self.frame_at(replay_time)
+        if index + 1 >= len(self.times):
+            return float(self.x[index]), float(self.y[index])
+        start, end = self.search_times[index], self.search_times[index + 1]
+        t = (replay_time - start) / (end - start) if end > start else 0.0
+        t = min(1.0, max(0.0, t))
+        x = self.x[index] + (self.x[index + 1] - self.x[index]) * t
+        y = self.y[index] + (self.y[index + 1] - self.y[index]) * t
+        return float(x), float(y)
+
+
+class TimelineStack:
+    # complete timelines laid end to end, each shifted past the previous one, so a single
+    # searchsorted over the flattened times finds the current frame of every replay at once
+    def __init__(self, timelines):
+        lengths = np.array([len(timeline) for timeline in timelines], dtype=np.int64)
+        if len(lengths) == 0 or (lengths == 0).any():
+            raise ValueError("every stacked timeline needs at least one frame")
+        self.starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        self.lasts = self.starts + lengths - 1
+        self.x = np.concatenate([timeline.x for timeline in timelines])
+        self.y = np.concatenate([timeline.y for timeline in timelines])
+        self.keys = np.concatenate([timeline.keys for timeline in timelines])
+        self.durations = np.array([timeline.duration for timeline in timelines])
+
+        search_times = np.concatenate([timeline.search_times for timeline in timelines])
+        first = min(float(timeline.search_times[0]) for timeline in timelines)
+        # rows never overlap once each is offset by more than the widest time range
+        span = float(self.durations.max()) - min(first, 0.0) + 1
+        self.row_offsets = np.arange(len(lengths)) * span
+        self.search_times = search_times + np.repeat(self.row_offsets, lengths)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def duration(self):
+        return float(self.durations.max())
+
+    def rows(self, values, ndim):
+        return values.reshape((-1,) + (1,) * (ndim - 1))
+
+    def cursors_at(self, times):
+        # times is one replay time for all rows, or an array with one row per replay (e.g. trail samples)
+        times = np.asarray(times, dtype=np.float64)
+        if times.ndim == 0:
+            times = np.full(len(self), float(times))
+        query = times + self.rows(self.row_offsets, times.ndim)
+        last = self.rows(self.lasts, times.ndim)
+        # clamping to the row bounds also covers queries before a replay starts or after it ends
+        index = np.clip(np.searchsorted(self.search_times, query, side='right') - 1,
+                        self.rows(self.starts, times.ndim), last)
+        following = np.minimum(index + 1, last)
+        start, end = self.search_times[index], self.search_times[following]
+        gap = end - start
+        t = np.clip(np.where(gap > 0, (query - start) / np.where(gap > 0, gap, 1), 0.0), 0.0, 1.0)
+        x = self.x[index] + (self.x[following] - self.x[index]) * t
+        y = self.y[index] + (self.y[following] - self.y[index]) * t
+        return x, y, index